@@ -0,0 +1,300 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import config
+
+# Нагрузочный прогон планировщика и слоя данных на синтетической базе.
+# Каждый размер базы меряется в отдельном процессе, чтобы пиковая память
+# и кэши соединений одного прогона не влияли на следующий:
+#
+#   python3 -m benchmarks.run --sizes 10000 100000 1000000
+
+DEFAULT_MIX = 'daily=40,weekly=25,monthly=10,yearly=5,once=20'
+REMINDER_TYPES = ('daily', 'weekly', 'monthly', 'yearly', 'once')
+
+class FakeBot:
+    """Заглушка context.bot: ничего не отправляет, только считает и ждёт latency."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.sent = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sent += 1
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, weight = part.split('=')
+        if name not in REMINDER_TYPES:
+            raise argparse.ArgumentTypeError(f"unknown reminder type: {name}")
+        mix[name] = float(weight)
+    return mix
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS — байты
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def populate(args, now):
+    """Заполняет базу args.reminders синтетическими напоминаниями."""
+    from database.storage import engine
+    from database.recurrence import next_fire_utc, format_next_fire, get_timezone
+
+    rng = random.Random(args.seed)
+    types, weights = zip(*args.mix.items())
+    tz = get_timezone(None)
+    # Кластеризация: все напоминания приходятся на hot_minutes популярных
+    # минут суток (0 — равномерно по суткам)
+    hot = [rng.randrange(24 * 60) for _ in range(args.hot_minutes)]
+    local_now = now.astimezone(tz)
+
+    def reminder():
+        reminder_type = rng.choices(types, weights)[0]
+        minute_of_day = rng.choice(hot) if hot else rng.randrange(24 * 60)
+        weekday_mask = rng.randrange(1, 128) if reminder_type == 'weekly' else 0
+        day = date = None
+        if reminder_type in ('monthly', 'yearly', 'once'):
+            day = local_now + timedelta(days=rng.randrange(1, 365))
+            date = (day.year * 100 + day.month) * 100 + day.day
+        if rng.random() < args.due_share:
+            # Срабатывает в этот tick; часть — с опозданием внутри окна догоняния
+            next_fire_at = now - timedelta(seconds=rng.randrange(args.lag * 60 + 1))
+        else:
+            year, month_day = divmod(date, 10000) if date else (0, 0)
+            next_fire_at = next_fire_utc(reminder_type, minute_of_day, weekday_mask,
+                                         year, *divmod(month_day, 100), tz, now)
+        # Поля как у импорта; срабатывание задаём сами, чтобы часть напоминаний опаздывала
+        return {
+            'user_id': rng.randrange(args.users),
+            'text': f"Напоминание {rng.randrange(10 ** 6)}",
+            'reminder_type': reminder_type,
+            'time': '%02d:%02d' % divmod(minute_of_day, 60),
+            'days_of_week': ','.join(str(weekday + 1) for weekday in range(7) if weekday_mask >> weekday & 1),
+            'date': day.strftime('%Y-%m-%d') if day else None,
+            'next_fire_at': format_next_fire(next_fire_at),
+        }
+
+    inserted = 0
+    while inserted < args.reminders:
+        batch = min(args.batch_size, args.reminders - inserted)
+        engine.add_reminders([reminder() for _ in range(batch)])
+        inserted += batch
+
+def measure(func, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return repeat / (time.perf_counter() - started)
+
+def bench_db(args):
+    """Операции в секунду для основных функций выбранного хранилища."""
+    from database.storage import engine as db
+
+    rng = random.Random(args.seed + 1)
+    reminder_ids = [row[0] for row in db.get_scheduled_reminders()]
+    sample = rng.sample(reminder_ids, min(len(reminder_ids), args.db_repeat))
+    users = [rng.randrange(args.users) for _ in range(args.db_repeat)]
+    ops = {}
+
+    ops['get_user_reminders'] = measure(lambda: db.get_user_reminders(users.pop()), args.db_repeat)
+    ops['get_reminder_by_id'] = measure(lambda: db.get_reminder_by_id(rng.choice(reminder_ids)), args.db_repeat)
+    ops['add_reminder'] = measure(
+        lambda: db.add_reminder(rng.randrange(args.users), 'bench', 'daily', time='%02d:%02d' % (rng.randrange(24), rng.randrange(60))),
+        args.db_repeat
+    )
+    ops['toggle_reminder'] = measure(lambda: db.toggle_reminder(rng.choice(sample)), args.db_repeat)
+    ops['update_reminder'] = measure(
+        lambda: db.update_reminder(rng.choice(sample), time='%02d:%02d' % (rng.randrange(24), rng.randrange(60))),
+        args.db_repeat
+    )
+    return ops
+
+def bench_due_query(now):
+    from database.storage import engine as db
+
+    started = time.perf_counter()
+    due = db.get_due_reminders(now)
+    return {'due': len(due), 'get_due_reminders_ms': (time.perf_counter() - started) * 1000}
+
+async def bench_ticks(args):
+    """Длительность tick'а check_reminders и скорость отправки через DeliveryQueue."""
+    from database import async_db
+    from scheduler.delivery import DeliveryQueue
+    from main import check_reminders
+
+    bot = FakeBot(args.send_latency)
+    delivery = DeliveryQueue(
+        bot,
+        on_finished=async_db.finish_deliveries,
+        workers=args.workers,
+        global_rate=args.send_rate,
+        chat_interval=0,
+        max_attempts=1
+    )
+    delivery.start()
+    context = SimpleNamespace(bot=bot, bot_data={'delivery': delivery})
+
+    ticks = []
+    send_started = time.perf_counter()
+    for _ in range(args.ticks):
+        started = time.perf_counter()
+        await check_reminders(context)
+        ticks.append((time.perf_counter() - started) * 1000)
+    await delivery.join()
+    send_elapsed = time.perf_counter() - send_started
+    await delivery.stop()
+
+    return {
+        # Первый tick обрабатывает все просроченные, остальные — почти пустые
+        'first_tick_ms': ticks[0],
+        'idle_tick_ms': min(ticks[1:]) if len(ticks) > 1 else None,
+        'sent': bot.sent,
+        'sends_per_sec': bot.sent / send_elapsed if send_elapsed else None,
+    }
+
+def run_single(args):
+    # Базу подменяем до первого импорта модулей database: хранилище и путь
+    # к файлу читаются из config при импорте
+    config.DATABASE_ENGINE = args.engine
+    path = None
+    if args.engine == 'sqlite':
+        path = args.db or os.path.join(tempfile.mkdtemp(prefix='reminder-bench-'), 'reminders.db')
+        if os.path.exists(path):
+            os.remove(path)
+        config.DATABASE_PATH = path
+
+    from database import async_db
+    from database.storage import engine
+    from database.recurrence import utc_now
+    import main  # noqa: F401 — настраивает logging, уровень задаём после
+    logging.getLogger().setLevel(args.log_level)
+
+    engine.init_db()
+    now = utc_now()
+    started = time.perf_counter()
+    populate(args, now)
+    result = {
+        'engine': args.engine,
+        'reminders': args.reminders,
+        'populate_sec': time.perf_counter() - started,
+    }
+    # Сначала горячий путь планировщика на нетронутых данных, потом
+    # операции обработчиков, которые эти данные меняют
+    result.update(bench_due_query(now))
+    result.update(asyncio.run(bench_ticks(args)))
+    result.update(bench_db(args))
+    async_db.shutdown()
+    result['peak_rss_mb'] = peak_rss_mb()
+    if path:
+        result['db_size_mb'] = round(os.path.getsize(path) / 2 ** 20, 1)
+        if not args.db:
+            os.remove(path)
+    return result
+
+def format_table(results):
+    columns = [
+        ('engine', 'engine', '{}'),
+        ('reminders', 'reminders', '{:d}'),
+        ('due', 'due', '{:d}'),
+        ('first_tick_ms', 'tick ms', '{:.1f}'),
+        ('idle_tick_ms', 'idle tick ms', '{:.1f}'),
+        ('sends_per_sec', 'sends/s', '{:.0f}'),
+        ('get_due_reminders_ms', 'due query ms', '{:.1f}'),
+        ('get_user_reminders', 'user list/s', '{:.0f}'),
+        ('get_reminder_by_id', 'by id/s', '{:.0f}'),
+        ('add_reminder', 'add/s', '{:.0f}'),
+        ('update_reminder', 'update/s', '{:.0f}'),
+        ('toggle_reminder', 'toggle/s', '{:.0f}'),
+        ('peak_rss_mb', 'peak RSS MB', '{:.1f}'),
+    ]
+    rows = [[title for _, title, _ in columns]]
+    for result in results:
+        rows.append([
+            '-' if result.get(key) is None else fmt.format(result[key])
+            for key, _, fmt in columns
+        ])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+    return '\n'.join('  '.join(cell.rjust(width) for cell, width in zip(row, widths)) for row in rows)
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный прогон планировщика и базы напоминаний')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='размеры базы, каждый меряется в отдельном процессе')
+    parser.add_argument('--reminders', type=int, help='один прогон на заданном размере (используется внутри)')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f'доли типов напоминаний, по умолчанию {DEFAULT_MIX}')
+    parser.add_argument('--users', type=int, default=10000, help='число пользователей')
+    parser.add_argument('--due-share', type=float, default=0.01,
+                        help='доля напоминаний, срабатывающих в первый tick')
+    parser.add_argument('--lag', type=int, default=5,
+                        help='на сколько минут могут опаздывать срабатывающие напоминания')
+    parser.add_argument('--hot-minutes', type=int, default=0,
+                        help='сколько популярных минут суток делят все напоминания (0 — равномерно)')
+    parser.add_argument('--ticks', type=int, default=3, help='сколько раз вызвать check_reminders')
+    parser.add_argument('--workers', type=int, default=config.DELIVERY_WORKERS, help='воркеров отправки')
+    parser.add_argument('--send-rate', type=float, default=10 ** 6,
+                        help='общий лимит отправки в секунду (по умолчанию без ограничения)')
+    parser.add_argument('--send-latency', type=float, default=0.0, help='задержка ответа заглушки бота, секунд')
+    parser.add_argument('--db-repeat', type=int, default=2000, help='повторов каждой операции с базой')
+    parser.add_argument('--batch-size', type=int, default=10000, help='строк в одной транзакции при заполнении')
+    parser.add_argument('--seed', type=int, default=1, help='seed генератора данных')
+    parser.add_argument('--engine', choices=['sqlite', 'memory'], default=config.DATABASE_ENGINE,
+                        help='хранилище (DATABASE_ENGINE); memory — без диска')
+    parser.add_argument('--db', help='путь к базе SQLite (по умолчанию временный файл)')
+    parser.add_argument('--log-level', default='WARNING', help='уровень логирования во время прогона')
+    parser.add_argument('--json', action='store_true', help='вывести результаты в JSON')
+    args = parser.parse_args()
+
+    if args.reminders:
+        print(json.dumps(run_single(args)))
+        return
+
+    results = []
+    for size in args.sizes:
+        command = [sys.executable, '-m', 'benchmarks.run', '--reminders', str(size)]
+        command += [arg for arg in sys.argv[1:] if arg != '--json']
+        command = _without_option(command, '--sizes')
+        output = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(format_table(results))
+
+def _without_option(command, option):
+    # Убирает option вместе с его значениями из аргументов дочернего процесса
+    result = []
+    skipping = False
+    for arg in command:
+        if arg == option:
+            skipping = True
+            continue
+        if skipping and not arg.startswith('--'):
+            continue
+        skipping = False
+        result.append(arg)
+    return result
+
+if __name__ == '__main__':
+    main()
@@ -2,3 +2,84 @@
 
 TELEGRAM_TOKEN = ''
 #OWNER_ID = ''
+ADMIN_IDS = []                  # user_id администраторов: выгрузка и загрузка напоминаний всех пользователей
+
+# Уровень логирования; 'DEBUG' включает построчную трассировку планировщика и отправки
+LOG_LEVEL = 'INFO'
+
+# Метрики в формате Prometheus на http://METRICS_HOST:METRICS_PORT/metrics.
+# None — не запускать. Каждому процессу (в том числе --worker) нужен свой порт
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = None
+
+# Получение обновлений: 'polling' или 'webhook'
+UPDATE_MODE = 'polling'
+CONCURRENT_UPDATES = 8          # обновлений, обрабатываемых одновременно (только в режиме webhook;
+                                # обновления одного пользователя — всегда по очереди)
+WEBHOOK_URL = None              # публичный https-адрес для Telegram, например 'https://bot.example.com/telegram';
+                                # None — не регистрировать webhook (локальная проверка сервера)
+WEBHOOK_LISTEN = '127.0.0.1'    # обычно за reverse proxy с TLS
+WEBHOOK_PORT = 8443
+WEBHOOK_PATH = '/telegram'
+WEBHOOK_SECRET_TOKEN = ''       # 1–256 символов A-Z, a-z, 0-9, _ и -; Telegram пришлёт его в заголовке
+WEBHOOK_MAX_CONNECTIONS = 40    # одновременных соединений от Telegram
+
+# Часовой пояс пользователей, которые не выбрали свой (/timezone)
+DEFAULT_TIMEZONE = 'Europe/Moscow'
+
+# База данных
+DATABASE_ENGINE = 'sqlite'      # 'sqlite' — файл DATABASE_PATH; 'memory' — в памяти процесса, без диска
+                                # (напоминания пропадают при перезапуске; для проверок и нагрузочных прогонов)
+DATABASE_PATH = 'reminders.db'
+DATABASE_STATEMENT_CACHE = 256  # подготовленных запросов на соединение
+DATABASE_PRAGMAS = {
+    'auto_vacuum': 'INCREMENTAL',  # для новых баз; место освобождает обслуживание
+    'journal_mode': 'WAL',      # читатели не блокируют запись
+    'synchronous': 'NORMAL',    # в режиме WAL это безопасно и заметно быстрее
+    'busy_timeout': 5000,
+    'cache_size': -16000,       # 16 МБ страничного кэша
+    'temp_store': 'MEMORY',
+}
+DATABASE_READ_WORKERS = 4       # потоков для чтения; запись всегда в одном потоке
+
+# Отправка напоминаний
+DELIVERY_WORKERS = 8            # одновременных отправок
+DELIVERY_GLOBAL_RATE = 25       # сообщений в секунду на всего бота (лимит Telegram ~30);
+                                # с --worker делится между процессами по числу их партиций
+DELIVERY_CHAT_INTERVAL = 1.0    # секунд между сообщениями в один чат
+DELIVERY_MAX_ATTEMPTS = 5       # попыток при временных ошибках
+DELIVERY_RETRY_BASE_DELAY = 2.0 # первая задержка повтора, дальше удваивается
+DELIVERY_HISTORY_DAYS = 30      # сколько дней хранится журнал отправок (таблица deliveries)
+DIGEST_MAX_LENGTH = 4000        # символов в одном сообщении-сводке (лимит Telegram 4096)
+
+# Планировщик
+SCHEDULER_MAX_CATCHUP_MINUTES = 60  # пропущенные (например, из-за перезапуска) напоминания
+                                    # отправляются, если опоздание не больше этого
+
+# Незавершённые диалоги (создание и редактирование напоминаний) переживают перезапуск
+PERSISTENCE_UPDATE_INTERVAL = 5        # секунд между записями изменившихся диалогов
+PERSISTENCE_STATE_TTL = 7 * 24 * 3600  # более старые диалоги после перезапуска не восстанавливаются
+
+# Фоновое обслуживание базы
+MAINTENANCE_INTERVAL = 3600         # секунд между проходами
+MAINTENANCE_BATCH_SIZE = 500        # строк в одной транзакции
+MAINTENANCE_ARCHIVE_AFTER_DAYS = 1  # через сколько дней удалённые и прошедшие одноразовые уходят в архив
+MAINTENANCE_VACUUM_PAGES = 1000     # страниц, возвращаемых системе за один шаг
+
+# Кэш чтения напоминаний для обработчиков
+REMINDER_CACHE_SIZE = 10000     # записей в каждом из кэшей (списки пользователей и отдельные напоминания)
+REMINDER_CACHE_TTL = 60         # секунд; ограничивает устаревание при записи из других процессов
+
+# Список напоминаний
+LIST_PAGE_SIZE = 10             # напоминаний на странице
+LIST_CACHE_SIZE = 10000         # пользователей с закэшированными страницами
+LIST_CACHE_TTL = 600            # секунд
+
+# Несколько процессов-планировщиков (python3 main.py --worker).
+# Включать во всех процессах, которые работают с одной базой
+WORKER_PARTITIONING = False
+WORKER_ID = None                # по умолчанию hostname:pid
+WORKER_PARTITION_COUNT = 64     # напоминания делятся по user_id
+WORKER_LEASE_TTL = 30           # секунд; после падения процесса его партиции заберут другие
+WORKER_LEASE_RENEW_INTERVAL = 10
+WORKER_RESYNC_INTERVAL = 30     # как часто перечитывать ближайшие срабатывания своих партиций
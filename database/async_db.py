@@ -0,0 +1,188 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .storage import engine as db
+from .cache import LRUCache, MISSING
+from monitoring.metrics import DB_QUERY_DURATION
+from config import DATABASE_READ_WORKERS, REMINDER_CACHE_SIZE, REMINDER_CACHE_TTL
+
+# Запись идёт через один поток: SQLite всё равно пропускает только одного
+# писателя, а ожидание блокировки не должно останавливать event loop.
+# Чтение в режиме WAL не мешает записи и выполняется в отдельном пуле.
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+_readers = ThreadPoolExecutor(max_workers=DATABASE_READ_WORKERS, thread_name_prefix='db-reader')
+
+async def run_read(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_readers, functools.partial(func, *args, **kwargs))
+
+async def run_write(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_writer, functools.partial(func, *args, **kwargs))
+
+def _timed(run, kind, func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await run(func, *args, **kwargs)
+        finally:
+            DB_QUERY_DURATION.observe(time.perf_counter() - started, query=func.__name__, kind=kind)
+    return wrapper
+
+def _read(func):
+    return _timed(run_read, 'read', func)
+
+def _write(func):
+    return _timed(run_write, 'write', func)
+
+# Кэш чтения для обработчиков: пользователь обычно несколько раз подряд
+# открывает одни и те же напоминания. Записи через этот модуль сбрасывают
+# затронутые ключи; изменения из других процессов видны через REMINDER_CACHE_TTL
+_user_reminders = LRUCache('user_reminders', REMINDER_CACHE_SIZE, REMINDER_CACHE_TTL)
+_reminders = LRUCache('reminder', REMINDER_CACHE_SIZE, REMINDER_CACHE_TTL)
+
+def _cached(cache, read):
+    @functools.wraps(read)
+    async def wrapper(key):
+        value = cache.get(key)
+        if value is MISSING:
+            version = cache.version()
+            value = await read(key)
+            cache.set(key, value, version)
+        return value
+    return wrapper
+
+# Производные кэши (например, отрисованный список) подписываются на сброс:
+# слушатель получает user_id или None, если сброшено всё
+_listeners = []
+
+def add_invalidation_listener(listener):
+    _listeners.append(listener)
+
+def _invalidate_user(user_id):
+    _user_reminders.pop(user_id)
+    for listener in _listeners:
+        listener(user_id)
+
+def invalidate(user_id=None, reminder_ids=()):
+    if user_id is not None:
+        _invalidate_user(user_id)
+    for reminder_id in reminder_ids:
+        reminder = _reminders.peek(reminder_id) if user_id is None else MISSING
+        if reminder not in (None, MISSING):
+            _invalidate_user(reminder.user_id)
+        _reminders.pop(reminder_id)
+
+def invalidate_all():
+    _user_reminders.clear()
+    _reminders.clear()
+    for listener in _listeners:
+        listener(None)
+
+def _with_owner(func):
+    # Владелец напоминания читается в том же вызове потока записи, чтобы
+    # после изменения сбросить и список его напоминаний
+    @functools.wraps(func)
+    def wrapper(reminder_id, *args, **kwargs):
+        return db.get_reminder_owner(reminder_id), func(reminder_id, *args, **kwargs)
+    return wrapper
+
+def _invalidates_reminder(func):
+    write = _write(_with_owner(func))
+
+    @functools.wraps(func)
+    async def wrapper(reminder_id, *args, **kwargs):
+        owner, result = await write(reminder_id, *args, **kwargs)
+        invalidate(owner, [reminder_id])
+        return result
+    return wrapper
+
+def _invalidates_all(write):
+    @functools.wraps(write)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await write(*args, **kwargs)
+        finally:
+            invalidate_all()
+    return wrapper
+
+get_user_reminders = _cached(_user_reminders, _read(db.get_user_reminders))
+get_reminder_by_id = _cached(_reminders, _read(db.get_reminder_by_id))
+get_due_reminders = _read(db.get_due_reminders)
+get_scheduled_reminders = _read(db.get_scheduled_reminders)
+
+update_reminder = _invalidates_reminder(db.update_reminder)
+toggle_reminder = _invalidates_reminder(db.toggle_reminder)
+delete_reminder = _invalidates_reminder(db.delete_reminder)
+acquire_partitions = _write(db.acquire_partitions)
+release_partitions = _write(db.release_partitions)
+get_scheduler_state = _read(db.get_scheduler_state)
+set_scheduler_state = _write(db.set_scheduler_state)
+get_user_timezone = _read(db.get_user_timezone)
+get_user_digest = _read(db.get_user_digest)
+get_user_states = _read(db.get_user_states)
+save_user_states = _write(db.save_user_states)
+deactivate_completed = _invalidates_all(_write(db.deactivate_completed))
+archive_reminders = _invalidates_all(_write(db.archive_reminders))
+incremental_vacuum = _write(db.incremental_vacuum)
+get_pending_deliveries = _read(db.get_pending_deliveries)
+get_deliveries = _read(db.get_deliveries)
+prune_deliveries = _write(db.prune_deliveries)
+
+_add_reminder = _write(db.add_reminder)
+_add_reminders = _write(db.add_reminders)
+_claim_due_reminders = _write(db.claim_due_reminders)
+_finish_deliveries = _write(db.finish_deliveries)
+_reactivate_user = _write(db.reactivate_user)
+_set_user_timezone = _write(db.set_user_timezone)
+_set_user_digest = _write(db.set_user_digest)
+
+async def add_reminder(user_id, *args, **kwargs):
+    reminder_id = await _add_reminder(user_id, *args, **kwargs)
+    invalidate(user_id)
+    return reminder_id
+
+async def add_reminders(reminders):
+    reminder_ids = await _add_reminders(reminders)
+    for user_id in {reminder['user_id'] for reminder in reminders}:
+        invalidate(user_id)
+    return reminder_ids
+
+async def claim_due_reminders(reminders, after=None, messages=None, worker_id=None):
+    # Захват сдвигает срабатывание и отключает отработавшие одноразовые
+    claimed = await _claim_due_reminders(reminders, after, messages, worker_id)
+    claimed_ids = set(claimed)
+    for reminder in reminders:
+        if reminder.id in claimed_ids:
+            invalidate(reminder.user_id, [reminder.id])
+    return claimed
+
+async def finish_deliveries(results):
+    suspended = await _finish_deliveries(results)
+    invalidate(reminder_ids=[result[0] for result in results if result[3] == 'sent'])
+    for user_id, reminder_ids in suspended.items():
+        invalidate(user_id, reminder_ids)
+    return suspended
+
+async def reactivate_user(user_id):
+    reminder_ids = await _reactivate_user(user_id)
+    if reminder_ids is not None:
+        invalidate(user_id, reminder_ids)
+    return reminder_ids
+
+async def set_user_digest(user_id, enabled):
+    # Режим сводки хранится в закэшированных напоминаниях пользователя
+    await _set_user_digest(user_id, enabled)
+    invalidate(user_id)
+
+async def set_user_timezone(user_id, timezone):
+    reminder_ids = await _set_user_timezone(user_id, timezone)
+    invalidate(user_id, reminder_ids)
+    return reminder_ids
+
+def shutdown():
+    _writer.shutdown(wait=True)
+    _readers.shutdown(wait=True)
+    db.close()
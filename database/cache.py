@@ -0,0 +1,59 @@
+import time
+from collections import OrderedDict
+from monitoring.metrics import CACHE_REQUESTS
+
+MISSING = object()
+
+class LRUCache:
+    """Кэш с ограничением размера (вытесняется давно не использованное) и
+    временем жизни записей. Используется только из event loop, без блокировок.
+
+    Чтение из базы идёт параллельно с записью, поэтому результат, прочитанный
+    до сброса, нельзя класть в кэш после него: set принимает версию, полученную
+    через version() до чтения, и ничего не сохраняет, если с тех пор был сброс.
+    """
+
+    def __init__(self, name, maxsize, ttl):
+        self.name = name
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        self._version = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def version(self):
+        return self._version
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] > time.monotonic():
+            self._entries.move_to_end(key)
+            CACHE_REQUESTS.inc(cache=self.name, result='hit')
+            return entry[0]
+        if entry is not None:
+            del self._entries[key]
+        CACHE_REQUESTS.inc(cache=self.name, result='miss')
+        return MISSING
+
+    def peek(self, key):
+        # Без учёта в статистике и без продления
+        entry = self._entries.get(key)
+        return entry[0] if entry is not None else MISSING
+
+    def set(self, key, value, version):
+        if version != self._version:
+            return
+        self._entries[key] = (value, time.monotonic() + self._ttl)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key):
+        self._version += 1
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._version += 1
+        self._entries.clear()
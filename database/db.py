@@ -1,93 +1,356 @@
-import sqlite3
-from datetime import datetime
 import logging
-from .db_context import database_connection
+import time as time_module
+from .db_context import database_connection, transaction, close_connections
+from .recurrence import (
+    compile_schedule, format_next_fire, date_to_int, get_timezone, utc_now, compute_next_fire, schedule_columns, local_today
+)
+from .models import Reminder, delivery_health
+from .migrations import migrate
+
+# Напоминания читаются вместе с настройками владельца (последние колонки)
+_SELECT_REMINDERS = '''
+    SELECT reminders.id, reminders.user_id, text, reminder_type, minute_of_day, weekday_mask,
+           date, is_active, last_reminded, next_fire_at, users.timezone, users.digest
+    FROM reminders
+    LEFT JOIN users ON users.user_id = reminders.user_id
+'''
+
+# Ограничение SQLite на число параметров в одном запросе
+_CHUNK_SIZE = 500
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), _CHUNK_SIZE):
+        yield ids[start:start + _CHUNK_SIZE]
+
+def _placeholders(chunk):
+    return ", ".join("?" * len(chunk))
+
+def _refresh_next_fire(c, reminder_ids, after=None):
+    # У приостановленных пользователей (чат недоступен) next_fire_at остаётся
+    # NULL до reactivate_user, что бы ни менялось в напоминаниях
+    updates = []
+    for chunk in _chunks(reminder_ids):
+        c.execute(f'''
+            SELECT id, reminder_type, minute_of_day, weekday_mask, date, is_active, users.timezone, users.suspended_at
+            FROM reminders LEFT JOIN users ON users.user_id = reminders.user_id
+            WHERE id IN ({_placeholders(chunk)})
+        ''', chunk)
+        for reminder_id, reminder_type, minute_of_day, weekday_mask, date, is_active, timezone, suspended_at in c.fetchall():
+            next_fire_at = None
+            if is_active and suspended_at is None:
+                next_fire_at = compute_next_fire(reminder_type, minute_of_day, weekday_mask, date, timezone, after)
+            updates.append((next_fire_at, reminder_id))
+    c.executemany('UPDATE reminders SET next_fire_at = ? WHERE id = ?', updates)
 
 def init_db():
-    conn = sqlite3.connect('reminders.db')
-    c = conn.cursor()
-    
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS reminders
-        (id INTEGER PRIMARY KEY AUTOINCREMENT,
-         user_id INTEGER,
-         text TEXT,
-         reminder_type TEXT,
-         days_of_week TEXT,
-         time TEXT,
-         date TEXT,
-         is_active INTEGER,
-         last_reminded TEXT)
-    ''')
-    
-    conn.commit()
-    conn.close()
+    # Схема создаётся и обновляется миграциями, см. database/migrations.py
+    migrate()
+
+def close():
+    close_connections()
 
 def add_reminder(user_id, text, reminder_type, days_of_week=None, time=None, date=None):
-    conn = sqlite3.connect('reminders.db')
-    c = conn.cursor()
-    
-    c.execute('''
-        INSERT INTO reminders (user_id, text, reminder_type, days_of_week, time, date, is_active, last_reminded)
-        VALUES (?, ?, ?, ?, ?, ?, 1, ?)
-    ''', (user_id, text, reminder_type, days_of_week, time, date, datetime.now().strftime('%Y-%m-%d')))
-    
-    reminder_id = c.lastrowid
-    conn.commit()
-    conn.close()
-    return reminder_id
+    minute_of_day, weekday_mask, _, _, _ = compile_schedule(days_of_week, time, None)
+    date = date_to_int(date)
+    with transaction() as conn:
+        c = conn.cursor()
+        c.execute('SELECT timezone, suspended_at FROM users WHERE user_id = ?', (user_id,))
+        timezone, suspended_at = c.fetchone() or (None, None)
+        next_fire_at = None
+        if suspended_at is None:
+            next_fire_at = compute_next_fire(reminder_type, minute_of_day, weekday_mask, date, timezone)
+        c.execute('''
+            INSERT INTO reminders (user_id, text, reminder_type, minute_of_day, weekday_mask, date, is_active, last_reminded, next_fire_at)
+            VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?)
+        ''', (user_id, text, reminder_type, minute_of_day, weekday_mask, date, local_today(), next_fire_at))
+        return c.lastrowid
 
 def get_user_reminders(user_id):
-    conn = sqlite3.connect('reminders.db')
-    c = conn.cursor()
-    
-    c.execute('SELECT * FROM reminders WHERE user_id = ? AND is_active = 1', (user_id,))
-    reminders = c.fetchall()
-    
-    conn.close()
-    return reminders
+    with database_connection() as conn:
+        c = conn.cursor()
+        c.execute(_SELECT_REMINDERS + 'WHERE reminders.user_id = ? AND is_active = 1 ORDER BY id', (user_id,))
+        return [Reminder.from_row(row) for row in c.fetchall()]
 
 def delete_reminder(reminder_id):
-    conn = sqlite3.connect('reminders.db')
-    c = conn.cursor()
-    
-    c.execute('UPDATE reminders SET is_active = 0 WHERE id = ?', (reminder_id,))
-    
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        # Удалённые строки переносит в архив фоновое обслуживание (scheduler/maintenance.py)
+        conn.execute('UPDATE reminders SET is_active = 0, next_fire_at = NULL, deleted_at = ? WHERE id = ?',
+                     (int(time_module.time()), reminder_id))
 
-def update_last_reminded(reminder_id):
-    conn = sqlite3.connect('reminders.db')
-    c = conn.cursor()
-    
-    c.execute('UPDATE reminders SET last_reminded = ? WHERE id = ?', 
-              (datetime.now().strftime('%Y-%m-%d'), reminder_id))
+def get_due_reminders(now, partitions=None, partition_count=None):
+    with database_connection() as conn:
+        c = conn.cursor()
+        if partitions is None:
+            c.execute(_SELECT_REMINDERS + '''
+                WHERE is_active = 1 AND next_fire_at <= ?
+                ORDER BY next_fire_at ASC
+            ''', (format_next_fire(now),))
+            return [Reminder.from_row(row) for row in c.fetchall()]
+        
+        if not partitions:
+            return []
+        partitions = list(partitions)
+        c.execute(_SELECT_REMINDERS + f'''
+            WHERE is_active = 1 AND next_fire_at <= ?
+              AND abs(reminders.user_id) % ? IN ({_placeholders(partitions)})
+            ORDER BY next_fire_at ASC
+        ''', [format_next_fire(now), partition_count] + partitions)
+        return [Reminder.from_row(row) for row in c.fetchall()]
+
+def claim_due_reminders(reminders, after=None, messages=None, worker_id=None):
+    # Сдвиг next_fire_at работает как захват: UPDATE проходит, только если
+    # значение не изменил другой процесс. Возвращает id захваченных напоминаний.
+    # Новое значение всегда позже старого, поэтому захват удаётся только одному.
+    # Для захваченных напоминаний с текстом в messages (id -> текст) в той же
+    # транзакции записывается отправка в журнал deliveries со статусом pending
+    # и процессом worker_id (в режиме нескольких процессов)
+    after = after or utc_now()
+    messages = messages or {}
+    created_at = int(time_module.time())
+    claimed = []
+    with transaction() as conn:
+        c = conn.cursor()
+        deliveries = []
+        for reminder in reminders:
+            new_next_fire_at = format_next_fire(reminder.next_occurrence(max(after, reminder.next_fire_datetime())))
+            # Без следующего срабатывания (одноразовое) напоминание сразу отключается
+            c.execute('''
+                UPDATE reminders SET next_fire_at = ?, is_active = CASE WHEN ? IS NULL THEN 0 ELSE is_active END
+                WHERE id = ? AND next_fire_at = ?
+            ''', (new_next_fire_at, new_next_fire_at, reminder.id, reminder.next_fire_at))
+            if c.rowcount:
+                claimed.append(reminder.id)
+                if reminder.id in messages:
+                    deliveries.append((reminder.id, reminder.next_fire_at, reminder.user_id,
+                                       messages[reminder.id], created_at, worker_id))
+        c.executemany('''
+            INSERT OR IGNORE INTO deliveries (reminder_id, occurrence, user_id, text, status, created_at, worker_id)
+            VALUES (?, ?, ?, ?, 'pending', ?, ?)
+        ''', deliveries)
+    return claimed
+
+def finish_deliveries(results):
+    # results — кортежи (reminder_id, occurrence, user_id, status, attempts, код ошибки, ошибка),
+    # status — 'sent', 'failed' или 'undeliverable' (чат недоступен насовсем).
+    # Все итоги пачки — одной транзакцией: журнал, last_reminded отправленных,
+    # состояние доставки пользователей и приостановка недоступных.
+    # Возвращает {user_id: id напоминаний} приостановленных пользователей (и уже
+    # приостановленных, если у них нашлись запланированные напоминания)
+    finished_at = int(time_module.time())
+    today = local_today()
+    health = delivery_health(results)
     
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        c = conn.cursor()
+        c.executemany('''
+            UPDATE deliveries SET status = ?, attempts = attempts + ?, error_code = ?, error = ?, finished_at = ?
+            WHERE reminder_id = ? AND occurrence = ? AND status = 'pending'
+        ''', [(status, attempts, error_code, error, finished_at, reminder_id, occurrence)
+              for reminder_id, occurrence, _, status, attempts, error_code, error in results])
+        c.executemany('UPDATE reminders SET last_reminded = ? WHERE id = ?',
+                      [(today, result[0]) for result in results if result[3] == 'sent'])
+        
+        c.executemany('UPDATE users SET delivery_failures = 0 WHERE user_id = ? AND delivery_failures != 0',
+                      [(user_id,) for user_id, (reset, failures, _, _) in health.items() if reset and not failures])
+        c.executemany('''
+            INSERT INTO users (user_id, delivery_failures, last_error) VALUES (?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                delivery_failures = CASE WHEN ? THEN excluded.delivery_failures
+                                         ELSE delivery_failures + excluded.delivery_failures END,
+                last_error = excluded.last_error
+        ''', [(user_id, failures, last_error, reset)
+              for user_id, (reset, failures, last_error, _) in health.items() if failures])
+        
+        suspended = {}
+        undeliverable = [user_id for user_id, (_, _, _, dead) in health.items() if dead]
+        for chunk in _chunks(undeliverable):
+            placeholders = _placeholders(chunk)
+            c.execute(f'SELECT user_id FROM users WHERE user_id IN ({placeholders}) AND suspended_at IS NULL', chunk)
+            users = [row[0] for row in c.fetchall()]
+            if users:
+                c.execute(f'UPDATE users SET suspended_at = ? WHERE user_id IN ({_placeholders(users)})',
+                          [finished_at] + users)
+            for user_id in users:
+                suspended[user_id] = []
+            # Напоминания снимаем и у уже приостановленных: запланированные могли
+            # остаться с прошлых версий или попасть в выборку до приостановки
+            condition = f'''
+                user_id IN ({placeholders}) AND is_active = 1 AND next_fire_at IS NOT NULL
+                AND user_id IN (SELECT user_id FROM users WHERE suspended_at IS NOT NULL)
+            '''
+            c.execute('SELECT user_id, id FROM reminders WHERE ' + condition, chunk)
+            for user_id, reminder_id in c.fetchall():
+                suspended.setdefault(user_id, []).append(reminder_id)
+            # Все напоминания приостановленных — одним UPDATE; без next_fire_at
+            # они не попадают ни в выборку планировщика, ни в его очередь
+            c.execute('UPDATE reminders SET next_fire_at = NULL WHERE ' + condition, chunk)
+        return suspended
 
-def get_active_reminders():
-    with database_connection() as conn:
+def reactivate_user(user_id):
+    # Снимает приостановку и заново считает срабатывания. Возвращает id
+    # напоминаний или None, если пользователь не был приостановлен
+    with transaction() as conn:
         c = conn.cursor()
         c.execute('''
-            SELECT * FROM reminders 
-            WHERE is_active = 1 
-            ORDER BY time ASC
-        ''')
+            UPDATE users SET suspended_at = NULL, delivery_failures = 0
+            WHERE user_id = ? AND suspended_at IS NOT NULL
+        ''', (user_id,))
+        if not c.rowcount:
+            return None
+        c.execute('SELECT id FROM reminders WHERE user_id = ? AND is_active = 1', (user_id,))
+        reminder_ids = [row[0] for row in c.fetchall()]
+        _refresh_next_fire(c, reminder_ids)
+        return reminder_ids
+
+def get_pending_deliveries(partitions=None, partition_count=None, worker_id=None, include_own=True):
+    # Отправки, не завершённые до остановки: (reminder_id, occurrence, user_id, text, digest).
+    # С worker_id — только те, чей процесс больше не работает (его нет в
+    # scheduler_workers) или, если include_own, захваченные самим worker_id:
+    # отправки живого процесса ещё стоят в его очереди
+    with database_connection() as conn:
+        c = conn.cursor()
+        query = '''
+            SELECT reminder_id, occurrence, deliveries.user_id, text, IFNULL(users.digest, 0)
+            FROM deliveries LEFT JOIN users ON users.user_id = deliveries.user_id
+            WHERE status = 'pending'
+        '''
+        params = []
+        if worker_id is not None:
+            query += '''
+                AND (deliveries.worker_id IS NULL
+                     OR deliveries.worker_id NOT IN (SELECT worker_id FROM scheduler_workers)
+                     OR (? AND deliveries.worker_id = ?))
+            '''
+            params += [int(include_own), worker_id]
+        if partitions is not None:
+            if not partitions:
+                return []
+            partitions = list(partitions)
+            query += f' AND abs(deliveries.user_id) % ? IN ({_placeholders(partitions)})'
+            params += [partition_count] + partitions
+        c.execute(query + ' ORDER BY occurrence', params)
+        return c.fetchall()
+
+def get_deliveries(user_id=None, reminder_id=None, limit=100):
+    # История отправок, новые первыми: (reminder_id, occurrence, user_id, text,
+    # status, attempts, error_code, error, created_at, finished_at)
+    conditions, params = [], []
+    if user_id is not None:
+        conditions.append('user_id = ?')
+        params.append(user_id)
+    if reminder_id is not None:
+        conditions.append('reminder_id = ?')
+        params.append(reminder_id)
+    where = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+    with database_connection() as conn:
+        c = conn.cursor()
+        c.execute(f'''
+            SELECT reminder_id, occurrence, user_id, text, status, attempts, error_code, error, created_at, finished_at
+            FROM deliveries {where}
+            ORDER BY occurrence DESC LIMIT ?
+        ''', params + [limit])
         return c.fetchall()
 
+def prune_deliveries(finished_before, batch_size):
+    # Удаляет одну пачку завершённых отправок старше finished_before (unix-время)
+    with transaction() as conn:
+        c = conn.cursor()
+        c.execute('''
+            DELETE FROM deliveries WHERE rowid IN (
+                SELECT rowid FROM deliveries
+                WHERE finished_at IS NOT NULL AND finished_at < ?
+                LIMIT ?)
+        ''', (finished_before, batch_size))
+        return c.rowcount
+
+def acquire_partitions(worker_id, partition_count, ttl):
+    now = time_module.time()
+    with transaction() as conn:
+        c = conn.cursor()
+        
+        # Первая же запись берёт блокировку на запись, поэтому остальное
+        # в транзакции видит согласованное состояние аренды
+        c.execute('''
+            INSERT INTO scheduler_workers (worker_id, heartbeat_at) VALUES (?, ?)
+            ON CONFLICT(worker_id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at
+        ''', (worker_id, now))
+        c.execute('DELETE FROM scheduler_workers WHERE heartbeat_at < ?', (now - ttl,))
+        c.execute('SELECT COUNT(*) FROM scheduler_workers')
+        fair_share = -(-partition_count // c.fetchone()[0])
+        
+        c.execute('UPDATE worker_leases SET expires_at = ? WHERE owner = ?', (now + ttl, worker_id))
+        c.execute('SELECT partition FROM worker_leases WHERE owner = ? ORDER BY partition', (worker_id,))
+        owned = [row[0] for row in c.fetchall() if row[0] < partition_count]
+        
+        if len(owned) > fair_share:
+            # Появились новые процессы — отдаём лишние партиции
+            c.executemany('DELETE FROM worker_leases WHERE partition = ? AND owner = ?',
+                          [(partition, worker_id) for partition in owned[fair_share:]])
+            owned = owned[:fair_share]
+        elif len(owned) < fair_share:
+            # Забираем свободные партиции и партиции упавших процессов
+            c.execute('SELECT partition FROM worker_leases WHERE expires_at >= ?', (now,))
+            taken = {row[0] for row in c.fetchall()}
+            free = [partition for partition in range(partition_count) if partition not in taken]
+            free = free[:fair_share - len(owned)]
+            c.executemany('INSERT OR REPLACE INTO worker_leases (partition, owner, expires_at) VALUES (?, ?, ?)',
+                          [(partition, worker_id, now + ttl) for partition in free])
+            owned = sorted(owned + free)
+        
+        return owned
+
+def get_scheduler_state(keys):
+    keys = list(keys)
+    state = dict.fromkeys(keys)
+    with database_connection() as conn:
+        c = conn.cursor()
+        for chunk in _chunks(keys):
+            c.execute(f'SELECT key, value FROM scheduler_state WHERE key IN ({_placeholders(chunk)})', chunk)
+            state.update(c.fetchall())
+    return state
+
+def set_scheduler_state(keys, value):
+    with transaction() as conn:
+        conn.executemany('''
+            INSERT INTO scheduler_state (key, value) VALUES (?, ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        ''', [(key, value) for key in keys])
+
+def release_partitions(worker_id):
+    with transaction() as conn:
+        conn.execute('DELETE FROM worker_leases WHERE owner = ?', (worker_id,))
+        conn.execute('DELETE FROM scheduler_workers WHERE worker_id = ?', (worker_id,))
+
+def get_scheduled_reminders(reminder_ids=None):
+    with database_connection() as conn:
+        c = conn.cursor()
+        if reminder_ids is None:
+            c.execute('''
+                SELECT id, next_fire_at FROM reminders
+                WHERE is_active = 1 AND next_fire_at IS NOT NULL
+            ''')
+            return c.fetchall()
+        
+        # Для удалённых и отключенных напоминаний возвращаем None
+        scheduled = dict.fromkeys(reminder_ids)
+        for chunk in _chunks(scheduled):
+            c.execute(f'''
+                SELECT id, next_fire_at FROM reminders
+                WHERE is_active = 1 AND id IN ({_placeholders(chunk)})
+            ''', chunk)
+            scheduled.update(c.fetchall())
+        return list(scheduled.items())
+
 def get_reminder_by_id(reminder_id):
-    conn = sqlite3.connect('reminders.db')
-    c = conn.cursor()
-    
-    c.execute('SELECT * FROM reminders WHERE id = ?', (reminder_id,))
-    reminder = c.fetchone()
-    
-    conn.close()
-    return reminder
+    with database_connection() as conn:
+        c = conn.cursor()
+        c.execute(_SELECT_REMINDERS + 'WHERE id = ?', (reminder_id,))
+        return Reminder.from_row(c.fetchone())
 
 def update_reminder(reminder_id, **kwargs):
-    with database_connection() as conn:
+    kwargs = schedule_columns(kwargs)
+    with transaction() as conn:
         c = conn.cursor()
         
         update_fields = [f'{key} = ?' for key in kwargs.keys()]
@@ -95,19 +358,184 @@ def update_reminder(reminder_id, **kwargs):
         
         query = f'UPDATE reminders SET {", ".join(update_fields)} WHERE id = ?'
         c.execute(query, params)
-        conn.commit()
+        _refresh_next_fire(c, [reminder_id])
 
 def toggle_reminder(reminder_id):
-    conn = sqlite3.connect('reminders.db')
-    c = conn.cursor()
-    
-    c.execute('UPDATE reminders SET is_active = CASE WHEN is_active = 1 THEN 0 ELSE 1 END WHERE id = ?', 
-              (reminder_id,))
-    
-    c.execute('SELECT is_active FROM reminders WHERE id = ?', (reminder_id,))
-    new_status = c.fetchone()[0]
-    
-    conn.commit()
-    conn.close()
-    
-    return new_status
\ No newline at end of file
+    with transaction() as conn:
+        c = conn.cursor()
+        
+        # Удалённые напоминания обратно не включаются
+        c.execute('''
+            UPDATE reminders SET is_active = CASE WHEN is_active = 1 THEN 0 ELSE 1 END
+            WHERE id = ? AND deleted_at IS NULL
+        ''', (reminder_id,))
+        
+        c.execute('SELECT is_active FROM reminders WHERE id = ? AND deleted_at IS NULL', (reminder_id,))
+        row = c.fetchone()
+        new_status = row[0] if row else 0
+        _refresh_next_fire(c, [reminder_id])
+        
+        return new_status
+
+def get_user_timezone(user_id):
+    with database_connection() as conn:
+        c = conn.cursor()
+        c.execute('SELECT timezone FROM users WHERE user_id = ?', (user_id,))
+        row = c.fetchone()
+        return get_timezone(row[0] if row else None).key
+
+def set_user_timezone(user_id, timezone):
+    # Пересчитываем срабатывания всех напоминаний пользователя в той же транзакции.
+    # Возвращает id напоминаний, у которых изменилось время срабатывания
+    with transaction() as conn:
+        c = conn.cursor()
+        c.execute('''
+            INSERT INTO users (user_id, timezone) VALUES (?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET timezone = excluded.timezone
+        ''', (user_id, timezone))
+        c.execute('SELECT id FROM reminders WHERE user_id = ? AND is_active = 1', (user_id,))
+        reminder_ids = [row[0] for row in c.fetchall()]
+        _refresh_next_fire(c, reminder_ids)
+        return reminder_ids
+
+def get_user_digest(user_id):
+    with database_connection() as conn:
+        row = conn.execute('SELECT digest FROM users WHERE user_id = ?', (user_id,)).fetchone()
+        return bool(row and row[0])
+
+def set_user_digest(user_id, enabled):
+    with transaction() as conn:
+        conn.execute('''
+            INSERT INTO users (user_id, digest) VALUES (?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET digest = excluded.digest
+        ''', (user_id, 1 if enabled else 0))
+
+def get_user_states(since=None):
+    # Состояние незавершённых диалогов; записи старше since не загружаем
+    with database_connection() as conn:
+        c = conn.cursor()
+        c.execute('SELECT user_id, data FROM user_states WHERE updated_at >= ?', (since or 0,))
+        return c.fetchall()
+
+def save_user_states(states):
+    # states — пары (user_id, данные JSON); None вместо данных удаляет запись
+    now = time_module.time()
+    with transaction() as conn:
+        conn.executemany('''
+            INSERT INTO user_states (user_id, data, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+        ''', [(user_id, data, now) for user_id, data in states if data is not None])
+        conn.executemany('DELETE FROM user_states WHERE user_id = ?',
+                         [(user_id,) for user_id, data in states if data is None])
+
+def add_reminders(reminders):
+    # Пакетная вставка одной транзакцией (импорт). reminders — словари с полями
+    # add_reminder, user_id, is_active и, если срабатывание уже известно,
+    # next_fire_at; возвращает id вставленных строк
+    with transaction() as conn:
+        c = conn.cursor()
+        timezones, suspended = {}, set()
+        for chunk in _chunks({reminder['user_id'] for reminder in reminders}):
+            c.execute(f'SELECT user_id, timezone, suspended_at FROM users WHERE user_id IN ({_placeholders(chunk)})',
+                      chunk)
+            for user_id, timezone, suspended_at in c.fetchall():
+                timezones[user_id] = timezone
+                if suspended_at is not None:
+                    suspended.add(user_id)
+        
+        today = local_today()
+        rows = []
+        for reminder in reminders:
+            minute_of_day, weekday_mask, _, _, _ = compile_schedule(reminder.get('days_of_week'), reminder['time'], None)
+            date = date_to_int(reminder.get('date'))
+            is_active = 1 if reminder.get('is_active', True) else 0
+            next_fire_at = reminder.get('next_fire_at')
+            if reminder['user_id'] in suspended:
+                next_fire_at = None
+            elif is_active and next_fire_at is None:
+                next_fire_at = compute_next_fire(reminder['reminder_type'], minute_of_day, weekday_mask, date,
+                                                  timezones.get(reminder['user_id']))
+            rows.append((reminder['user_id'], reminder['text'], reminder['reminder_type'], minute_of_day,
+                         weekday_mask, date, is_active, today, next_fire_at))
+        # По строке, а не executemany: id нужны, чтобы передать новые
+        # напоминания планировщику
+        reminder_ids = []
+        for row in rows:
+            c.execute('''
+                INSERT INTO reminders (user_id, text, reminder_type, minute_of_day, weekday_mask, date, is_active, last_reminded, next_fire_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', row)
+            reminder_ids.append(c.lastrowid)
+        return reminder_ids
+
+def iter_reminders(user_id=None, active_only=False):
+    # Строки отдаются по мере чтения курсора, без fetchall, поэтому экспорт
+    # любого размера идёт в постоянной памяти
+    conditions, params = ['deleted_at IS NULL'], []
+    if user_id is not None:
+        conditions.append('reminders.user_id = ?')
+        params.append(user_id)
+    if active_only:
+        conditions.append('is_active = 1')
+    query = _SELECT_REMINDERS + 'WHERE ' + ' AND '.join(conditions)
+    with database_connection() as conn:
+        for row in conn.execute(query + ' ORDER BY reminders.id', params):
+            yield Reminder.from_row(row)
+
+def deactivate_completed(batch_size):
+    # Одноразовые, которые уже сработали (или были созданы без будущего
+    # срабатывания), отключаем. Возвращает число отключённых
+    with transaction() as conn:
+        c = conn.cursor()
+        c.execute('''
+            UPDATE reminders SET is_active = 0 WHERE id IN (
+                SELECT id FROM reminders
+                WHERE is_active = 1 AND next_fire_at IS NULL
+                  AND user_id NOT IN (SELECT user_id FROM users WHERE suspended_at IS NOT NULL)
+                LIMIT ?)
+        ''', (batch_size,))
+        return c.rowcount
+
+def archive_reminders(deleted_before, expired_before, batch_size):
+    # Переносит в reminders_archive одну пачку строк: удалённые раньше
+    # deleted_before (unix-время) и отключённые одноразовые с датой раньше
+    # expired_before (YYYYMMDD). Возвращает число перенесённых строк
+    batch_size = min(batch_size, _CHUNK_SIZE)
+    with transaction() as conn:
+        c = conn.cursor()
+        c.execute('''
+            SELECT id FROM reminders
+            WHERE is_active = 0
+              AND (deleted_at <= ? OR (deleted_at IS NULL AND reminder_type = 'once' AND date < ?))
+            LIMIT ?
+        ''', (deleted_before, expired_before, batch_size))
+        reminder_ids = [row[0] for row in c.fetchall()]
+        if not reminder_ids:
+            return 0
+        placeholders = _placeholders(reminder_ids)
+        c.execute(f'''
+            INSERT OR REPLACE INTO reminders_archive
+                (id, user_id, text, reminder_type, minute_of_day, weekday_mask, date,
+                 last_reminded, deleted_at, archived_at, reason)
+            SELECT id, user_id, text, reminder_type, minute_of_day, weekday_mask, date,
+                   last_reminded, deleted_at, ?, CASE WHEN deleted_at IS NULL THEN 'expired' ELSE 'deleted' END
+            FROM reminders WHERE id IN ({placeholders})
+        ''', [int(time_module.time())] + reminder_ids)
+        c.execute(f'DELETE FROM reminders WHERE id IN ({placeholders})', reminder_ids)
+        return len(reminder_ids)
+
+def incremental_vacuum(pages):
+    # Возвращает системе до pages свободных страниц; работает, только если
+    # база создана (или пересобрана VACUUM) с auto_vacuum = INCREMENTAL
+    with database_connection() as conn:
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            return 0
+        free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        # execute выполняет только первый шаг прагмы (одну страницу), executescript — до конца
+        conn.executescript(f'PRAGMA incremental_vacuum({int(pages)});')
+        return free - conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+def get_reminder_owner(reminder_id):
+    with database_connection() as conn:
+        row = conn.execute('SELECT user_id FROM reminders WHERE id = ?', (reminder_id,)).fetchone()
+        return row[0] if row else None
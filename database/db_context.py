@@ -1,16 +1,55 @@
 from contextlib import contextmanager
 import sqlite3
 import logging
+import threading
+from config import DATABASE_PATH, DATABASE_PRAGMAS, DATABASE_STATEMENT_CACHE
+
+# Одно постоянное соединение на поток: одновременно пользоваться одним
+# соединением из разных потоков нельзя, а открывать его на каждый запрос дорого
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+
+def _connect():
+    # check_same_thread=False нужен только для close_connections при остановке
+    conn = sqlite3.connect(DATABASE_PATH, cached_statements=DATABASE_STATEMENT_CACHE, check_same_thread=False)
+    for name, value in DATABASE_PRAGMAS.items():
+        conn.execute(f'PRAGMA {name} = {value}')
+    return conn
+
+def get_connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = _connect()
+        _local.conn = conn
+        with _connections_lock:
+            _connections.append(conn)
+    return conn
 
 @contextmanager
 def database_connection():
-    conn = None
+    conn = get_connection()
     try:
-        conn = sqlite3.connect('reminders.db')
         yield conn
     except sqlite3.Error as e:
         logging.error(f"Database error: {e}")
+        conn.rollback()
         raise
-    finally:
-        if conn:
-            conn.close() 
\ No newline at end of file
+
+@contextmanager
+def transaction():
+    # Всё, что выполнено внутри блока, фиксируется одним commit
+    with database_connection() as conn:
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+
+def close_connections():
+    with _connections_lock:
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
+    _local.__dict__.pop('conn', None)
@@ -0,0 +1,495 @@
+import bisect
+import threading
+import time as time_module
+from collections import deque
+from .recurrence import (
+    compile_schedule, date_to_int, format_next_fire, get_timezone, utc_now, compute_next_fire, schedule_columns, local_today
+)
+from .models import Reminder, delivery_health, partition_of
+
+# Хранилище в памяти процесса с теми же операциями, что database/db.py
+# (см. database/storage.py). Данные не переживают перезапуск и не видны другим
+# процессам — для нагрузочных прогонов без диска и небольших установок,
+# которым не нужна история. Операции выполняются под одной блокировкой,
+# поэтому каждая атомарна, как транзакция в SQLite.
+#
+# Индексы: _due — отсортированные (next_fire_at, id) активных напоминаний,
+# выборка наступивших — срез по bisect; _by_user — id напоминаний
+# пользователя; _unscheduled и _inactive — кандидаты для обслуживания.
+
+_lock = threading.RLock()
+
+class _Row:
+    __slots__ = ('id', 'user_id', 'text', 'reminder_type', 'minute_of_day', 'weekday_mask',
+                 'date', 'is_active', 'last_reminded', 'next_fire_at', 'deleted_at')
+
+    def __init__(self, id, user_id, text, reminder_type, minute_of_day, weekday_mask,
+                 date, is_active, last_reminded, next_fire_at, deleted_at=None):
+        self.id = id
+        self.user_id = user_id
+        self.text = text
+        self.reminder_type = reminder_type
+        self.minute_of_day = minute_of_day
+        self.weekday_mask = weekday_mask
+        self.date = date
+        self.is_active = is_active
+        self.last_reminded = last_reminded
+        self.next_fire_at = next_fire_at
+        self.deleted_at = deleted_at
+
+class _User:
+    __slots__ = ('timezone', 'digest', 'delivery_failures', 'last_error', 'suspended_at')
+
+    def __init__(self):
+        self.timezone = None
+        self.digest = 0
+        self.delivery_failures = 0
+        self.last_error = None
+        self.suspended_at = None
+
+class _Delivery:
+    __slots__ = ('reminder_id', 'occurrence', 'user_id', 'text', 'status', 'attempts',
+                 'error_code', 'error', 'created_at', 'finished_at', 'worker_id')
+
+    def __init__(self, reminder_id, occurrence, user_id, text, created_at, worker_id=None):
+        self.reminder_id = reminder_id
+        self.occurrence = occurrence
+        self.user_id = user_id
+        self.text = text
+        self.status = 'pending'
+        self.attempts = 0
+        self.error_code = None
+        self.error = None
+        self.created_at = created_at
+        self.finished_at = None
+        self.worker_id = worker_id
+
+_rows = {}
+_next_id = 1
+_by_user = {}
+_due = []
+_unscheduled = set()
+_inactive = set()
+_archive = {}
+_users = {}
+_deliveries = {}
+_deliveries_by_user = {}
+_pending = set()
+_finished = deque()
+_scheduler_state = {}
+_workers = {}
+_leases = {}
+_user_states = {}
+
+def _index(row):
+    if not row.is_active:
+        _inactive.add(row.id)
+    elif row.next_fire_at is None:
+        _unscheduled.add(row.id)
+    else:
+        bisect.insort(_due, (row.next_fire_at, row.id))
+
+def _unindex(row):
+    if not row.is_active:
+        _inactive.discard(row.id)
+    elif row.next_fire_at is None:
+        _unscheduled.discard(row.id)
+    else:
+        del _due[bisect.bisect_left(_due, (row.next_fire_at, row.id))]
+
+def _update(row, **columns):
+    _unindex(row)
+    for name, value in columns.items():
+        setattr(row, name, value)
+    _index(row)
+
+def _insert(user_id, text, reminder_type, minute_of_day, weekday_mask, date, is_active, last_reminded, next_fire_at):
+    global _next_id
+    row = _Row(_next_id, user_id, text, reminder_type, minute_of_day, weekday_mask,
+               date, is_active, last_reminded, next_fire_at)
+    _next_id += 1
+    _rows[row.id] = row
+    _by_user.setdefault(user_id, set()).add(row.id)
+    _index(row)
+    return row.id
+
+def _remove(row):
+    _unindex(row)
+    del _rows[row.id]
+    user_rows = _by_user[row.user_id]
+    user_rows.discard(row.id)
+    if not user_rows:
+        del _by_user[row.user_id]
+
+def _user(user_id):
+    user = _users.get(user_id)
+    if user is None:
+        user = _users[user_id] = _User()
+    return user
+
+def _timezone(user_id):
+    user = _users.get(user_id)
+    return user.timezone if user else None
+
+def _suspended(user_id):
+    user = _users.get(user_id)
+    return user is not None and user.suspended_at is not None
+
+def _to_reminder(row):
+    # Та же строка, что _SELECT_REMINDERS в database/db.py
+    user = _users.get(row.user_id)
+    return Reminder.from_row((
+        row.id, row.user_id, row.text, row.reminder_type, row.minute_of_day, row.weekday_mask,
+        row.date, row.is_active, row.last_reminded, row.next_fire_at,
+        user.timezone if user else None, user.digest if user else None
+    ))
+
+def _user_rows(user_id):
+    return [_rows[reminder_id] for reminder_id in sorted(_by_user.get(user_id, ()))]
+
+def _refresh_next_fire(reminder_ids, after=None):
+    for reminder_id in reminder_ids:
+        row = _rows.get(reminder_id)
+        if row is None:
+            continue
+        next_fire_at = None
+        if row.is_active and not _suspended(row.user_id):
+            next_fire_at = compute_next_fire(row.reminder_type, row.minute_of_day, row.weekday_mask, row.date,
+                                              _timezone(row.user_id), after)
+        _update(row, next_fire_at=next_fire_at)
+
+def _in_partitions(user_id, partitions, partition_count):
+    return partitions is None or partition_of(user_id, partition_count) in partitions
+
+def init_db():
+    # Схемы нет, данные живут до конца процесса
+    pass
+
+def close():
+    pass
+
+def add_reminder(user_id, text, reminder_type, days_of_week=None, time=None, date=None):
+    minute_of_day, weekday_mask, _, _, _ = compile_schedule(days_of_week, time, None)
+    date = date_to_int(date)
+    with _lock:
+        next_fire_at = None
+        if not _suspended(user_id):
+            next_fire_at = compute_next_fire(reminder_type, minute_of_day, weekday_mask, date, _timezone(user_id))
+        return _insert(user_id, text, reminder_type, minute_of_day, weekday_mask, date, 1, local_today(), next_fire_at)
+
+def get_user_reminders(user_id):
+    with _lock:
+        return [_to_reminder(row) for row in _user_rows(user_id) if row.is_active]
+
+def delete_reminder(reminder_id):
+    with _lock:
+        row = _rows.get(reminder_id)
+        if row:
+            _update(row, is_active=0, next_fire_at=None, deleted_at=int(time_module.time()))
+
+def get_due_reminders(now, partitions=None, partition_count=None):
+    with _lock:
+        if partitions is not None and not partitions:
+            return []
+        partitions = set(partitions) if partitions is not None else None
+        end = bisect.bisect_right(_due, (format_next_fire(now), float('inf')))
+        return [_to_reminder(_rows[reminder_id]) for _, reminder_id in _due[:end]
+                if _in_partitions(_rows[reminder_id].user_id, partitions, partition_count)]
+
+def claim_due_reminders(reminders, after=None, messages=None, worker_id=None):
+    # Та же семантика, что у database/db.py: захват проходит, только если
+    # next_fire_at не изменился с момента выборки
+    after = after or utc_now()
+    messages = messages or {}
+    created_at = int(time_module.time())
+    claimed = []
+    with _lock:
+        for reminder in reminders:
+            row = _rows.get(reminder.id)
+            if row is None or row.next_fire_at != reminder.next_fire_at:
+                continue
+            new_next_fire_at = format_next_fire(reminder.next_occurrence(max(after, reminder.next_fire_datetime())))
+            _update(row, next_fire_at=new_next_fire_at, is_active=row.is_active if new_next_fire_at else 0)
+            claimed.append(reminder.id)
+            key = (reminder.id, reminder.next_fire_at)
+            if reminder.id in messages and key not in _deliveries:
+                _deliveries[key] = _Delivery(reminder.id, reminder.next_fire_at, reminder.user_id,
+                                             messages[reminder.id], created_at, worker_id)
+                _deliveries_by_user.setdefault(reminder.user_id, set()).add(key)
+                _pending.add(key)
+    return claimed
+
+def finish_deliveries(results):
+    finished_at = int(time_module.time())
+    today = local_today()
+    health = delivery_health(results)
+    with _lock:
+        for reminder_id, occurrence, _, status, attempts, error_code, error in results:
+            key = (reminder_id, occurrence)
+            delivery = _deliveries.get(key)
+            if delivery is None or delivery.status != 'pending':
+                continue
+            delivery.status = status
+            delivery.attempts += attempts
+            delivery.error_code = error_code
+            delivery.error = error
+            delivery.finished_at = finished_at
+            _pending.discard(key)
+            _finished.append(key)
+            row = _rows.get(reminder_id)
+            if status == 'sent' and row:
+                row.last_reminded = today
+
+        suspended = {}
+        for user_id, (reset, failures, last_error, undeliverable) in health.items():
+            if failures:
+                user = _user(user_id)
+                user.delivery_failures = failures if reset else user.delivery_failures + failures
+                user.last_error = last_error
+            elif reset and user_id in _users:
+                _users[user_id].delivery_failures = 0
+            user = _users.get(user_id)
+            if not undeliverable or user is None:
+                continue
+            if user.suspended_at is None:
+                user.suspended_at = finished_at
+                suspended[user_id] = []
+            # Как в database/db.py: снимаем напоминания и у уже приостановленных
+            for row in _user_rows(user_id):
+                if row.is_active and row.next_fire_at is not None:
+                    suspended.setdefault(user_id, []).append(row.id)
+                    _update(row, next_fire_at=None)
+        return suspended
+
+def reactivate_user(user_id):
+    with _lock:
+        user = _users.get(user_id)
+        if user is None or user.suspended_at is None:
+            return None
+        user.suspended_at = None
+        user.delivery_failures = 0
+        reminder_ids = [row.id for row in _user_rows(user_id) if row.is_active]
+        _refresh_next_fire(reminder_ids)
+        return reminder_ids
+
+def get_pending_deliveries(partitions=None, partition_count=None, worker_id=None, include_own=True):
+    def orphaned(delivery):
+        return (worker_id is None or delivery.worker_id is None or delivery.worker_id not in _workers
+                or include_own and delivery.worker_id == worker_id)
+
+    with _lock:
+        if partitions is not None and not partitions:
+            return []
+        partitions = set(partitions) if partitions is not None else None
+        pending = sorted((_deliveries[key] for key in _pending), key=lambda delivery: delivery.occurrence)
+        return [(delivery.reminder_id, delivery.occurrence, delivery.user_id, delivery.text,
+                 _users[delivery.user_id].digest if delivery.user_id in _users else 0)
+                for delivery in pending
+                if _in_partitions(delivery.user_id, partitions, partition_count) and orphaned(delivery)]
+
+def get_deliveries(user_id=None, reminder_id=None, limit=100):
+    with _lock:
+        keys = _deliveries if user_id is None else _deliveries_by_user.get(user_id, ())
+        deliveries = [_deliveries[key] for key in keys if reminder_id is None or key[0] == reminder_id]
+        deliveries.sort(key=lambda delivery: delivery.occurrence, reverse=True)
+        return [(delivery.reminder_id, delivery.occurrence, delivery.user_id, delivery.text, delivery.status,
+                 delivery.attempts, delivery.error_code, delivery.error, delivery.created_at, delivery.finished_at)
+                for delivery in deliveries[:limit]]
+
+def prune_deliveries(finished_before, batch_size):
+    # _finished упорядочен по времени завершения
+    pruned = 0
+    with _lock:
+        while _finished and pruned < batch_size:
+            delivery = _deliveries.get(_finished[0])
+            if delivery is not None and delivery.finished_at >= finished_before:
+                break
+            key = _finished.popleft()
+            if delivery is None:
+                continue
+            del _deliveries[key]
+            user_keys = _deliveries_by_user[delivery.user_id]
+            user_keys.discard(key)
+            if not user_keys:
+                del _deliveries_by_user[delivery.user_id]
+            pruned += 1
+    return pruned
+
+def acquire_partitions(worker_id, partition_count, ttl):
+    # Один процесс — все партиции, но логика та же, что в database/db.py
+    now = time_module.time()
+    with _lock:
+        _workers[worker_id] = now
+        for worker, heartbeat_at in list(_workers.items()):
+            if heartbeat_at < now - ttl:
+                del _workers[worker]
+        fair_share = -(-partition_count // len(_workers))
+
+        owned = []
+        for partition, (owner, expires_at) in sorted(_leases.items()):
+            if owner == worker_id:
+                _leases[partition] = (owner, now + ttl)
+                if partition < partition_count:
+                    owned.append(partition)
+
+        if len(owned) > fair_share:
+            for partition in owned[fair_share:]:
+                del _leases[partition]
+            owned = owned[:fair_share]
+        elif len(owned) < fair_share:
+            taken = {partition for partition, (_, expires_at) in _leases.items() if expires_at >= now}
+            free = [partition for partition in range(partition_count) if partition not in taken]
+            free = free[:fair_share - len(owned)]
+            for partition in free:
+                _leases[partition] = (worker_id, now + ttl)
+            owned = sorted(owned + free)
+
+        return owned
+
+def get_scheduler_state(keys):
+    with _lock:
+        return {key: _scheduler_state.get(key) for key in keys}
+
+def set_scheduler_state(keys, value):
+    with _lock:
+        for key in keys:
+            _scheduler_state[key] = value
+
+def release_partitions(worker_id):
+    with _lock:
+        for partition, (owner, _) in list(_leases.items()):
+            if owner == worker_id:
+                del _leases[partition]
+        _workers.pop(worker_id, None)
+
+def get_scheduled_reminders(reminder_ids=None):
+    with _lock:
+        if reminder_ids is None:
+            return [(reminder_id, next_fire_at) for next_fire_at, reminder_id in _due]
+        scheduled = []
+        for reminder_id in dict.fromkeys(reminder_ids):
+            row = _rows.get(reminder_id)
+            scheduled.append((reminder_id, row.next_fire_at if row and row.is_active else None))
+        return scheduled
+
+def get_reminder_by_id(reminder_id):
+    with _lock:
+        row = _rows.get(reminder_id)
+        return _to_reminder(row) if row else None
+
+def update_reminder(reminder_id, **kwargs):
+    columns = schedule_columns(kwargs)
+    with _lock:
+        row = _rows.get(reminder_id)
+        if row:
+            _update(row, **columns)
+            _refresh_next_fire([reminder_id])
+
+def toggle_reminder(reminder_id):
+    with _lock:
+        row = _rows.get(reminder_id)
+        if row is None or row.deleted_at is not None:
+            return 0
+        _update(row, is_active=0 if row.is_active else 1)
+        _refresh_next_fire([reminder_id])
+        return row.is_active
+
+def get_user_timezone(user_id):
+    with _lock:
+        return get_timezone(_timezone(user_id)).key
+
+def set_user_timezone(user_id, timezone):
+    with _lock:
+        _user(user_id).timezone = timezone
+        reminder_ids = [row.id for row in _user_rows(user_id) if row.is_active]
+        _refresh_next_fire(reminder_ids)
+        return reminder_ids
+
+def get_user_digest(user_id):
+    with _lock:
+        user = _users.get(user_id)
+        return bool(user and user.digest)
+
+def set_user_digest(user_id, enabled):
+    with _lock:
+        _user(user_id).digest = 1 if enabled else 0
+
+def get_user_states(since=None):
+    with _lock:
+        return [(user_id, data) for user_id, (data, updated_at) in _user_states.items()
+                if updated_at >= (since or 0)]
+
+def save_user_states(states):
+    now = time_module.time()
+    with _lock:
+        for user_id, data in states:
+            if data is None:
+                _user_states.pop(user_id, None)
+            else:
+                _user_states[user_id] = (data, now)
+
+def add_reminders(reminders):
+    today = local_today()
+    reminder_ids = []
+    with _lock:
+        for reminder in reminders:
+            minute_of_day, weekday_mask, _, _, _ = compile_schedule(reminder.get('days_of_week'), reminder['time'], None)
+            date = date_to_int(reminder.get('date'))
+            is_active = 1 if reminder.get('is_active', True) else 0
+            next_fire_at = reminder.get('next_fire_at')
+            if _suspended(reminder['user_id']):
+                next_fire_at = None
+            elif is_active and next_fire_at is None:
+                next_fire_at = compute_next_fire(reminder['reminder_type'], minute_of_day, weekday_mask, date,
+                                                  _timezone(reminder['user_id']))
+            reminder_ids.append(_insert(reminder['user_id'], reminder['text'], reminder['reminder_type'],
+                                        minute_of_day, weekday_mask, date, is_active, today, next_fire_at))
+        return reminder_ids
+
+def iter_reminders(user_id=None, active_only=False):
+    # Снимок под блокировкой, отдача — уже без неё
+    with _lock:
+        rows = _user_rows(user_id) if user_id is not None else [_rows[key] for key in sorted(_rows)]
+        reminders = [_to_reminder(row) for row in rows
+                     if row.deleted_at is None and (row.is_active or not active_only)]
+    yield from reminders
+
+def deactivate_completed(batch_size):
+    with _lock:
+        candidates = []
+        for reminder_id in _unscheduled:
+            user = _users.get(_rows[reminder_id].user_id)
+            if user is None or user.suspended_at is None:
+                candidates.append(reminder_id)
+                if len(candidates) == batch_size:
+                    break
+        for reminder_id in candidates:
+            _update(_rows[reminder_id], is_active=0)
+        return len(candidates)
+
+def archive_reminders(deleted_before, expired_before, batch_size):
+    archived_at = int(time_module.time())
+    with _lock:
+        candidates = []
+        for reminder_id in _inactive:
+            row = _rows[reminder_id]
+            if row.deleted_at is not None and row.deleted_at <= deleted_before or (
+                    row.deleted_at is None and row.reminder_type == 'once' and row.date is not None
+                    and row.date < expired_before):
+                candidates.append(row)
+                if len(candidates) == batch_size:
+                    break
+        for row in candidates:
+            _archive[row.id] = (row.user_id, row.text, row.reminder_type, row.minute_of_day, row.weekday_mask,
+                                row.date, row.last_reminded, row.deleted_at, archived_at,
+                                'expired' if row.deleted_at is None else 'deleted')
+            _remove(row)
+        return len(candidates)
+
+def incremental_vacuum(pages):
+    return 0
+
+def get_reminder_owner(reminder_id):
+    with _lock:
+        row = _rows.get(reminder_id)
+        return row.user_id if row else None
@@ -0,0 +1,399 @@
+import argparse
+import logging
+import time
+from datetime import datetime
+from .db_context import get_connection, transaction
+from .recurrence import next_occurrence, next_fire_utc, split_date, get_timezone, format_next_fire, utc_now
+
+# Версия схемы хранится в PRAGMA user_version. Миграции применяются по порядку;
+# каждая должна быть безопасной для повторного запуска после сбоя и сама
+# выставляет user_version в последней своей транзакции.
+
+def _columns(c, table):
+    return [column[1] for column in c.execute(f'PRAGMA table_info({table})')]
+
+def _migrate_v1(conn, batch_size, pause):
+    # Исходная схема: время, дни недели и даты хранятся строками
+    with transaction():
+        c = conn.cursor()
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS reminders
+            (id INTEGER PRIMARY KEY AUTOINCREMENT,
+             user_id INTEGER,
+             text TEXT,
+             reminder_type TEXT,
+             days_of_week TEXT,
+             time TEXT,
+             date TEXT,
+             is_active INTEGER,
+             last_reminded TEXT,
+             next_fire_at TEXT)
+        ''')
+        if 'next_fire_at' not in _columns(c, 'reminders'):
+            c.execute('ALTER TABLE reminders ADD COLUMN next_fire_at TEXT')
+
+        # Аренда партиций для нескольких процессов-планировщиков
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS scheduler_workers
+            (worker_id TEXT PRIMARY KEY,
+             heartbeat_at REAL)
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS worker_leases
+            (partition INTEGER PRIMARY KEY,
+             owner TEXT,
+             expires_at REAL)
+        ''')
+
+        # Служебное состояние планировщика (отметки обработанного времени)
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS scheduler_state
+            (key TEXT PRIMARY KEY,
+             value TEXT)
+        ''')
+
+    # Заполняем next_fire_at для активных напоминаний, где оно ещё не посчитано
+    now = datetime.now()
+    last_id = 0
+    while True:
+        with transaction():
+            c = conn.cursor()
+            c.execute('''
+                SELECT id, reminder_type, days_of_week, time, date FROM reminders
+                WHERE is_active = 1 AND next_fire_at IS NULL AND id > ?
+                ORDER BY id LIMIT ?
+            ''', (last_id, batch_size))
+            rows = c.fetchall()
+            updates = []
+            for reminder_id, reminder_type, days_of_week, time_, date in rows:
+                moment = next_occurrence(reminder_type, days_of_week, time_, date, now)
+                if moment:
+                    updates.append((moment.strftime('%Y-%m-%d %H:%M'), reminder_id))
+            c.executemany('UPDATE reminders SET next_fire_at = ? WHERE id = ?', updates)
+        if len(rows) < batch_size:
+            break
+        last_id = rows[-1][0]
+        time.sleep(pause)
+
+    with transaction():
+        conn.execute('PRAGMA user_version = 1')
+
+# Преобразования строковых полей v1 в числа v2 на SQL: их используют
+# и пакетное копирование, и триггеры, которые переносят изменения,
+# сделанные работающим ботом во время миграции
+_V1_TO_V2_COLUMNS = '''
+    id,
+    user_id,
+    text,
+    reminder_type,
+    CASE WHEN time IS NULL OR time = '' THEN NULL
+         ELSE CAST(substr(time, 1, instr(time, ':') - 1) AS INTEGER) * 60
+              + CAST(substr(time, instr(time, ':') + 1) AS INTEGER) END,
+    (instr(',' || IFNULL(days_of_week, '') || ',', ',1,') > 0) * 1
+        + (instr(',' || IFNULL(days_of_week, '') || ',', ',2,') > 0) * 2
+        + (instr(',' || IFNULL(days_of_week, '') || ',', ',3,') > 0) * 4
+        + (instr(',' || IFNULL(days_of_week, '') || ',', ',4,') > 0) * 8
+        + (instr(',' || IFNULL(days_of_week, '') || ',', ',5,') > 0) * 16
+        + (instr(',' || IFNULL(days_of_week, '') || ',', ',6,') > 0) * 32
+        + (instr(',' || IFNULL(days_of_week, '') || ',', ',7,') > 0) * 64,
+    CASE WHEN date IS NULL OR date = '' THEN NULL
+         ELSE CAST(replace(date, '-', '') AS INTEGER) END,
+    is_active,
+    CASE WHEN last_reminded IS NULL OR last_reminded = '' THEN NULL
+         ELSE CAST(replace(last_reminded, '-', '') AS INTEGER) END,
+    CASE WHEN next_fire_at IS NULL OR next_fire_at = '' THEN NULL
+         ELSE CAST(replace(replace(replace(next_fire_at, '-', ''), ' ', ''), ':', '') AS INTEGER) END
+'''
+
+def _migrate_v2(conn, batch_size, pause):
+    # Компактная схема: минута суток, битовая маска дней недели,
+    # даты как YYYYMMDD и момент срабатывания как YYYYMMDDHHMM.
+    # Копирование идёт пачками в новую таблицу, а изменения, которые
+    # за это время делает работающий бот, переносят триггеры
+    with transaction():
+        c = conn.cursor()
+        # Остатки прерванного запуска не используем: без триггеров в них
+        # могли не попасть последние изменения
+        c.execute('DROP TRIGGER IF EXISTS reminders_v2_sync_insert')
+        c.execute('DROP TRIGGER IF EXISTS reminders_v2_sync_update')
+        c.execute('DROP TRIGGER IF EXISTS reminders_v2_sync_delete')
+        c.execute('DROP TABLE IF EXISTS reminders_v2')
+        c.execute('''
+            CREATE TABLE reminders_v2
+            (id INTEGER PRIMARY KEY AUTOINCREMENT,
+             user_id INTEGER NOT NULL,
+             text TEXT NOT NULL,
+             reminder_type TEXT NOT NULL,
+             minute_of_day INTEGER,
+             weekday_mask INTEGER NOT NULL DEFAULT 0,
+             date INTEGER,
+             is_active INTEGER NOT NULL DEFAULT 1,
+             last_reminded INTEGER,
+             next_fire_at INTEGER)
+        ''')
+        c.execute(f'''
+            CREATE TRIGGER reminders_v2_sync_insert AFTER INSERT ON reminders
+            BEGIN
+                INSERT OR REPLACE INTO reminders_v2 SELECT {_V1_TO_V2_COLUMNS} FROM reminders WHERE id = NEW.id;
+            END
+        ''')
+        c.execute(f'''
+            CREATE TRIGGER reminders_v2_sync_update AFTER UPDATE ON reminders
+            BEGIN
+                INSERT OR REPLACE INTO reminders_v2 SELECT {_V1_TO_V2_COLUMNS} FROM reminders WHERE id = NEW.id;
+            END
+        ''')
+        c.execute('''
+            CREATE TRIGGER reminders_v2_sync_delete AFTER DELETE ON reminders
+            BEGIN
+                DELETE FROM reminders_v2 WHERE id = OLD.id;
+            END
+        ''')
+
+    last_id = 0
+    copied = 0
+    while True:
+        with transaction():
+            c = conn.cursor()
+            c.execute('SELECT MAX(id), COUNT(*) FROM (SELECT id FROM reminders WHERE id > ? ORDER BY id LIMIT ?)',
+                      (last_id, batch_size))
+            batch_last_id, count = c.fetchone()
+            if count:
+                # OR IGNORE: строки, уже перенесённые триггером, свежее копии
+                c.execute(f'''
+                    INSERT OR IGNORE INTO reminders_v2
+                    SELECT {_V1_TO_V2_COLUMNS} FROM reminders WHERE id > ? AND id <= ?
+                ''', (last_id, batch_last_id))
+        if not count:
+            break
+        last_id = batch_last_id
+        copied += count
+        logging.info(f"Migration v2: copied {copied} reminders")
+        time.sleep(pause)
+
+    # Переключение — одна короткая транзакция. DDL в sqlite3 сам транзакцию
+    # не открывает, поэтому начинаем её явно
+    with transaction():
+        c = conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        c.execute("SELECT seq FROM sqlite_sequence WHERE name = 'reminders'")
+        row = c.fetchone()
+        sequence = row[0] if row else 0
+        c.execute('DROP TRIGGER IF EXISTS reminders_v2_sync_insert')
+        c.execute('DROP TRIGGER IF EXISTS reminders_v2_sync_update')
+        c.execute('DROP TRIGGER IF EXISTS reminders_v2_sync_delete')
+        c.execute('DROP TABLE reminders')
+        c.execute('ALTER TABLE reminders_v2 RENAME TO reminders')
+        # Не выдаём заново id, которые уже были у удалённых строк
+        c.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'reminders'", (sequence,))
+        c.execute('CREATE INDEX IF NOT EXISTS idx_reminders_user ON reminders (user_id)')
+        c.execute('''
+            CREATE INDEX IF NOT EXISTS idx_reminders_next_fire
+            ON reminders (next_fire_at) WHERE is_active = 1
+        ''')
+        c.execute('PRAGMA user_version = 2')
+
+# В v2 next_fire_at хранился как местное время сервера YYYYMMDDHHMM (≥ 1e11),
+# с v3 — unix-время UTC (заметно меньше), поэтому старые значения легко отличить
+_LOCAL_STAMP_MIN = 100000000000
+
+def _convert_to_utc(c, batch_size, now, last_id=0):
+    c.execute('''
+        SELECT id, reminder_type, minute_of_day, weekday_mask, date, is_active, users.timezone
+        FROM reminders LEFT JOIN users ON users.user_id = reminders.user_id
+        WHERE id > ? AND next_fire_at >= ?
+        ORDER BY id LIMIT ?
+    ''', (last_id, _LOCAL_STAMP_MIN, batch_size))
+    rows = c.fetchall()
+    updates = []
+    for reminder_id, reminder_type, minute_of_day, weekday_mask, date, is_active, timezone in rows:
+        moment = None
+        if is_active:
+            moment = next_fire_utc(reminder_type, minute_of_day, weekday_mask, *split_date(date),
+                                   get_timezone(timezone), now)
+        updates.append((format_next_fire(moment), reminder_id))
+    c.executemany('UPDATE reminders SET next_fire_at = ? WHERE id = ?', updates)
+    return rows[-1][0] if rows else None
+
+def _migrate_v3(conn, batch_size, pause):
+    # Часовые пояса пользователей; next_fire_at переходит на UTC
+    with transaction():
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS users
+            (user_id INTEGER PRIMARY KEY,
+             timezone TEXT)
+        ''')
+
+    now = utc_now()
+    last_id = 0
+    while True:
+        with transaction():
+            last_id = _convert_to_utc(conn.cursor(), batch_size, now, last_id)
+        if last_id is None:
+            break
+        time.sleep(pause)
+
+    # Последняя пачка — вместе с версией схемы, чтобы не остались строки,
+    # записанные старой версией бота во время миграции
+    with transaction():
+        c = conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        last_id = 0
+        while last_id is not None:
+            last_id = _convert_to_utc(c, batch_size, now, last_id)
+        c.execute('PRAGMA user_version = 3')
+
+def _migrate_v4(conn, batch_size, pause):
+    # Состояние незавершённых диалогов (context.user_data), см. database/persistence.py
+    with transaction():
+        c = conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS user_states
+            (user_id INTEGER PRIMARY KEY,
+             data TEXT NOT NULL,
+             updated_at REAL NOT NULL)
+        ''')
+        c.execute('PRAGMA user_version = 4')
+
+def _migrate_v5(conn, batch_size, pause):
+    # Отметка удаления и архив: удалённые и отработавшие строки уходят из
+    # рабочей таблицы, см. scheduler/maintenance.py
+    with transaction():
+        c = conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        if 'deleted_at' not in _columns(c, 'reminders'):
+            c.execute('ALTER TABLE reminders ADD COLUMN deleted_at INTEGER')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS reminders_archive
+            (id INTEGER PRIMARY KEY,
+             user_id INTEGER NOT NULL,
+             text TEXT NOT NULL,
+             reminder_type TEXT NOT NULL,
+             minute_of_day INTEGER,
+             weekday_mask INTEGER NOT NULL DEFAULT 0,
+             date INTEGER,
+             last_reminded INTEGER,
+             deleted_at INTEGER,
+             archived_at INTEGER NOT NULL,
+             reason TEXT NOT NULL)
+        ''')
+        # Обслуживание ищет кандидатов в архив только среди отключённых строк
+        c.execute('''
+            CREATE INDEX IF NOT EXISTS idx_reminders_inactive
+            ON reminders (id) WHERE is_active = 0
+        ''')
+        c.execute('PRAGMA user_version = 5')
+
+def _migrate_v6(conn, batch_size, pause):
+    # Журнал отправок: строка на каждое срабатывание (reminder_id, occurrence),
+    # occurrence — плановое время срабатывания (unix-время UTC), см. main.check_reminders
+    with transaction():
+        c = conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS deliveries
+            (reminder_id INTEGER NOT NULL,
+             occurrence INTEGER NOT NULL,
+             user_id INTEGER NOT NULL,
+             text TEXT NOT NULL,
+             status TEXT NOT NULL,
+             attempts INTEGER NOT NULL DEFAULT 0,
+             error TEXT,
+             created_at INTEGER NOT NULL,
+             finished_at INTEGER,
+             PRIMARY KEY (reminder_id, occurrence))
+        ''')
+        # Незавершённые отправки поднимаются при запуске
+        c.execute('''
+            CREATE INDEX IF NOT EXISTS idx_deliveries_pending
+            ON deliveries (occurrence) WHERE status = 'pending'
+        ''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_deliveries_user ON deliveries (user_id, occurrence)')
+        # Старую историю удаляет обслуживание
+        c.execute('''
+            CREATE INDEX IF NOT EXISTS idx_deliveries_finished
+            ON deliveries (finished_at) WHERE finished_at IS NOT NULL
+        ''')
+        c.execute('PRAGMA user_version = 6')
+
+def _migrate_v7(conn, batch_size, pause):
+    # Режим сводки: напоминания пользователя, сработавшие вместе, идут одним сообщением
+    with transaction():
+        c = conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        if 'digest' not in _columns(c, 'users'):
+            c.execute('ALTER TABLE users ADD COLUMN digest INTEGER NOT NULL DEFAULT 0')
+        c.execute('PRAGMA user_version = 7')
+
+def _migrate_v8(conn, batch_size, pause):
+    # Состояние доставки пользователю: неудачи подряд, код последней ошибки и
+    # отметка приостановки, если чат недоступен (бот заблокирован, аккаунт удалён).
+    # У напоминаний приостановленного пользователя next_fire_at = NULL
+    with transaction():
+        c = conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        columns = _columns(c, 'users')
+        if 'delivery_failures' not in columns:
+            c.execute('ALTER TABLE users ADD COLUMN delivery_failures INTEGER NOT NULL DEFAULT 0')
+        if 'last_error' not in columns:
+            c.execute('ALTER TABLE users ADD COLUMN last_error TEXT')
+        if 'suspended_at' not in columns:
+            c.execute('ALTER TABLE users ADD COLUMN suspended_at INTEGER')
+        if 'error_code' not in _columns(c, 'deliveries'):
+            c.execute('ALTER TABLE deliveries ADD COLUMN error_code TEXT')
+        c.execute('PRAGMA user_version = 8')
+
+def _migrate_v9(conn, batch_size, pause):
+    # Процесс (--worker), захвативший срабатывание: незавершённые отправки
+    # поднимает другой процесс, только если этот больше не работает
+    with transaction():
+        c = conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        if 'worker_id' not in _columns(c, 'deliveries'):
+            c.execute('ALTER TABLE deliveries ADD COLUMN worker_id TEXT')
+        c.execute('PRAGMA user_version = 9')
+
+MIGRATIONS = [
+    (1, _migrate_v1),
+    (2, _migrate_v2),
+    (3, _migrate_v3),
+    (4, _migrate_v4),
+    (5, _migrate_v5),
+    (6, _migrate_v6),
+    (7, _migrate_v7),
+    (8, _migrate_v8),
+    (9, _migrate_v9),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version():
+    return get_connection().execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(batch_size=1000, pause=0.0):
+    conn = get_connection()
+    version = get_schema_version()
+    for target, step in MIGRATIONS:
+        if version >= target:
+            continue
+        logging.info(f"Migrating database schema to v{target}")
+        step(conn, batch_size, pause)
+        version = target
+    return version
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Миграция схемы reminders.db; можно запускать, не останавливая бота'
+    )
+    parser.add_argument('--batch-size', type=int, default=1000, help='строк в одной транзакции')
+    parser.add_argument('--pause', type=float, default=0.05,
+                        help='пауза между пачками, чтобы не мешать боту, секунд')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
+    version = migrate(args.batch_size, args.pause)
+    logging.info(f"Database schema is at v{version}")
+
+if __name__ == '__main__':
+    main()
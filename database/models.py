@@ -0,0 +1,91 @@
+from .recurrence import next_fire_utc, parse_next_fire, split_date, get_timezone
+
+WEEKDAY_NAMES = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+
+class Reminder:
+    """Напоминание с заранее разобранным расписанием.
+
+    Расписание хранится целыми числами, как в базе: минута суток, маска дней
+    недели (бит 0 — понедельник) и дата. Текстовый вид нужен только для показа.
+    """
+
+    __slots__ = (
+        'id', 'user_id', 'text', 'reminder_type', 'minute_of_day', 'weekday_mask',
+        'year', 'month', 'day', 'is_active', 'last_reminded', 'next_fire_at', 'timezone', 'digest'
+    )
+
+    def __init__(self, id, user_id, text, reminder_type, minute_of_day, weekday_mask,
+                 year, month, day, is_active, last_reminded, next_fire_at, timezone=None, digest=False):
+        self.id = id
+        self.user_id = user_id
+        self.text = text
+        self.reminder_type = reminder_type
+        self.minute_of_day = minute_of_day
+        self.weekday_mask = weekday_mask
+        self.year = year
+        self.month = month
+        self.day = day
+        self.is_active = is_active
+        self.last_reminded = last_reminded
+        self.next_fire_at = next_fire_at
+        self.timezone = timezone
+        self.digest = digest
+
+    @classmethod
+    def from_row(cls, row):
+        # Строка reminders и, последними колонками, часовой пояс и режим сводки пользователя
+        if row is None:
+            return None
+        reminder_id, user_id, text, reminder_type, minute_of_day, weekday_mask, date, is_active, last_reminded, next_fire_at, timezone, digest = row
+        return cls(reminder_id, user_id, text, reminder_type, minute_of_day, weekday_mask, *split_date(date),
+                   is_active, last_reminded, next_fire_at, timezone, bool(digest))
+
+    @property
+    def tz(self):
+        return get_timezone(self.timezone)
+
+    def next_occurrence(self, after):
+        # after и результат — моменты с часовым поясом; результат в UTC
+        return next_fire_utc(self.reminder_type, self.minute_of_day, self.weekday_mask,
+                             self.year, self.month, self.day, self.tz, after)
+
+    def next_fire_datetime(self):
+        return parse_next_fire(self.next_fire_at)
+
+    @property
+    def time(self):
+        if self.minute_of_day is None:
+            return None
+        return '%02d:%02d' % divmod(self.minute_of_day, 60)
+
+    @property
+    def date(self):
+        return '%04d-%02d-%02d' % (self.year, self.month, self.day) if self.day else None
+
+    @property
+    def days_of_week(self):
+        return ','.join(str(day + 1) for day in range(7) if self.weekday_mask >> day & 1)
+
+    def weekday_names(self):
+        return [WEEKDAY_NAMES[day] for day in range(7) if self.weekday_mask >> day & 1]
+
+
+def partition_of(user_id, partition_count):
+    # Партиция пользователя при запуске нескольких планировщиков (--worker)
+    return abs(user_id) % partition_count
+
+def delivery_health(results):
+    # Итоги отправки (см. DeliveryQueue) по пользователям: {user_id: (была ли
+    # успешная отправка, неудач после неё, код последней ошибки, чат недоступен)}.
+    # Неудачи подряд считаем после последней успешной отправки в пачке. Итоги без
+    # попыток (не отправлялись: просрочены или чат уже признан недоступным) не считаем
+    health = {}
+    for _, _, user_id, status, attempts, error_code, _ in results:
+        reset, failures, last_error, undeliverable = health.get(user_id, (False, 0, None, False))
+        if not attempts:
+            health[user_id] = (reset, failures, last_error, undeliverable or status == 'undeliverable')
+        elif status == 'sent':
+            health[user_id] = (True, 0, last_error, undeliverable)
+        else:
+            health[user_id] = (reset, failures + 1, error_code, undeliverable or status == 'undeliverable')
+    return health
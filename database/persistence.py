@@ -0,0 +1,107 @@
+import asyncio
+import json
+import logging
+import time
+from telegram.ext import BasePersistence, PersistenceInput
+from . import async_db
+
+class SQLitePersistence(BasePersistence):
+    """Состояние диалогов (context.user_data) в таблице user_states.
+
+    Хранится только user_data: в bot_data лежат объекты планировщика, а
+    chat_data и callback_data бот не использует. Каждый пользователь — отдельная
+    строка JSON, поэтому запись не зависит от общего объёма состояния.
+    Application раз в update_interval передаёт изменившихся пользователей;
+    они копятся в памяти и записываются одной транзакцией.
+    """
+
+    def __init__(self, update_interval=60, state_ttl=None):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        self._state_ttl = state_ttl
+        self._pending = {}
+        self._write_task = None
+
+    async def get_user_data(self):
+        # Брошенные давно диалоги не поднимаем
+        since = time.time() - self._state_ttl if self._state_ttl else None
+        user_data = {}
+        for user_id, data in await async_db.get_user_states(since):
+            try:
+                user_data[user_id] = json.loads(data)
+            except ValueError:
+                logging.error(f"Corrupted dialog state of user {user_id} is ignored")
+        return user_data
+
+    async def update_user_data(self, user_id, data):
+        # Application уже передаёт копию, поэтому словарь можно хранить как есть
+        self._pending[user_id] = data
+        if self._write_task is None:
+            # Задача стартует после всех update_user_data текущего прохода
+            # update_persistence и запишет их вместе
+            self._write_task = asyncio.create_task(self._write_pending())
+
+    async def drop_user_data(self, user_id):
+        await self.update_user_data(user_id, {})
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def flush(self):
+        if self._write_task:
+            await self._write_task
+        await self._write_pending()
+
+    async def _write_pending(self):
+        try:
+            while self._pending:
+                pending, self._pending = self._pending, {}
+                states = []
+                for user_id, data in pending.items():
+                    try:
+                        states.append((user_id, json.dumps(data, ensure_ascii=False) if data else None))
+                    except (TypeError, ValueError) as e:
+                        logging.error(f"Dialog state of user {user_id} is not serializable: {e}")
+                try:
+                    await async_db.save_user_states(states)
+                except Exception as e:
+                    logging.error(f"Failed to save dialog state of {len(states)} users: {e}")
+        finally:
+            self._write_task = None
+
+    # Остальные данные не сохраняются (см. store_data)
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {}
+
+    async def update_conversation(self, name, key, new_state):
+        pass
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
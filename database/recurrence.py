@@ -0,0 +1,164 @@
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from config import DEFAULT_TIMEZONE
+
+def compile_schedule(days_of_week, time, date):
+    """Разбирает текстовые поля напоминания в числа.
+
+    Возвращает (minute_of_day, weekday_mask, year, month, day): минуту от начала
+    суток, маску дней недели (бит 0 — понедельник) и дату (нули, если её нет).
+    """
+    minute_of_day = None
+    if time:
+        hour, minute = time.split(':')
+        minute_of_day = int(hour) * 60 + int(minute)
+
+    weekday_mask = 0
+    if days_of_week:
+        for day in days_of_week.split(','):
+            if day:
+                weekday_mask |= 1 << (int(day) - 1)
+
+    year, month, day = split_date(date_to_int(date))
+    return minute_of_day, weekday_mask, year, month, day
+
+def date_to_int(date):
+    # 'YYYY-MM-DD' -> YYYYMMDD
+    if not date:
+        return None
+    year, month, day = (int(part) for part in date.split('-'))
+    return (year * 100 + month) * 100 + day
+
+def split_date(value):
+    if not value:
+        return 0, 0, 0
+    year, month_day = divmod(value, 10000)
+    return (year, *divmod(month_day, 100))
+
+@lru_cache(maxsize=None)
+def get_timezone(name):
+    if name:
+        try:
+            return ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            pass
+    return ZoneInfo(DEFAULT_TIMEZONE)
+
+def is_valid_timezone(name):
+    try:
+        ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+    return True
+
+def next_fire(reminder_type, minute_of_day, weekday_mask, year, month, day, after):
+    """Ближайшее срабатывание строго позже after или None (местное время без пояса)."""
+    if minute_of_day is None:
+        return None
+
+    hour, minute = divmod(minute_of_day, 60)
+    after = after.replace(second=0, microsecond=0)
+    today = after.replace(hour=hour, minute=minute)
+
+    if reminder_type == 'daily':
+        return today if today > after else today + timedelta(days=1)
+
+    if reminder_type == 'weekly':
+        if not weekday_mask:
+            return None
+        for offset in range(8):
+            candidate = today + timedelta(days=offset)
+            if candidate > after and weekday_mask >> candidate.weekday() & 1:
+                return candidate
+        return None
+
+    if not day:
+        return None
+
+    if reminder_type == 'once':
+        candidate = datetime(year, month, day, hour, minute)
+        return candidate if candidate > after else None
+
+    if reminder_type == 'monthly':
+        # Месяцы без нужного числа (например, 31-го) пропускаются
+        for offset in range(49):
+            month_index = after.month - 1 + offset
+            try:
+                candidate = datetime(after.year + month_index // 12, month_index % 12 + 1, day, hour, minute)
+            except ValueError:
+                continue
+            if candidate > after:
+                return candidate
+        return None
+
+    if reminder_type == 'yearly':
+        # 29 февраля срабатывает только в високосные годы
+        for offset in range(9):
+            try:
+                candidate = datetime(after.year + offset, month, day, hour, minute)
+            except ValueError:
+                continue
+            if candidate > after:
+                return candidate
+        return None
+
+    return None
+
+def next_fire_utc(reminder_type, minute_of_day, weekday_mask, year, month, day, tz, after):
+    """Ближайшее срабатывание в поясе tz строго позже after; результат в UTC.
+
+    Расписание считается по местным часам пользователя, переход на летнее
+    время учитывается здесь: несуществующее время (перевод вперёд) сдвигается
+    на час позже, повторяющееся (перевод назад) срабатывает один раз.
+    """
+    local_after = after.astimezone(tz).replace(tzinfo=None)
+    candidate = next_fire(reminder_type, minute_of_day, weekday_mask, year, month, day, local_after)
+    while candidate:
+        moment = candidate.replace(tzinfo=tz).astimezone(timezone.utc)
+        if moment > after:
+            return moment
+        candidate = next_fire(reminder_type, minute_of_day, weekday_mask, year, month, day, candidate)
+    return None
+
+def utc_now():
+    return datetime.now(timezone.utc)
+
+def next_occurrence(reminder_type, days_of_week, time, date, after):
+    return next_fire(reminder_type, *compile_schedule(days_of_week, time, date), after)
+
+def format_next_fire(moment):
+    # Момент срабатывания хранится в UTC как unix-время в секундах: один
+    # диапазонный запрос по индексу находит всё, что пора отправить, в любом поясе
+    if not moment:
+        return None
+    return int(moment.timestamp())
+
+def parse_next_fire(value):
+    if not value:
+        return None
+    return datetime.fromtimestamp(value, timezone.utc)
+
+def compute_next_fire(reminder_type, minute_of_day, weekday_mask, date, timezone_name, after=None):
+    # Значение колонки next_fire_at для расписания в числах схемы
+    return format_next_fire(next_fire_utc(reminder_type, minute_of_day, weekday_mask, *split_date(date),
+                                          get_timezone(timezone_name), after or utc_now()))
+
+def schedule_columns(fields):
+    # Обработчики передают время, дни недели и дату строками — переводим в числа схемы
+    columns = dict(fields)
+    if 'time' in columns or 'days_of_week' in columns or 'date' in columns:
+        minute_of_day, weekday_mask, _, _, _ = compile_schedule(columns.get('days_of_week'), columns.get('time'), None)
+        if 'time' in columns:
+            columns['minute_of_day'] = minute_of_day
+            del columns['time']
+        if 'days_of_week' in columns:
+            columns['weekday_mask'] = weekday_mask
+            del columns['days_of_week']
+        if 'date' in columns:
+            columns['date'] = date_to_int(columns['date'])
+    return columns
+
+def local_today():
+    # Сегодняшняя дата процесса в виде колонки date (YYYYMMDD)
+    return date_to_int(datetime.now().strftime('%Y-%m-%d'))
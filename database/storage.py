@@ -0,0 +1,43 @@
+import importlib
+from config import DATABASE_ENGINE
+
+# Хранилище выбирается в config.py (DATABASE_ENGINE). Движок — модуль с
+# функциями под именами из OPERATIONS:
+#   sqlite — database/db.py, файл DATABASE_PATH с настройками DATABASE_PRAGMAS;
+#   memory — database/memory_db.py, всё в памяти процесса (без диска и без
+#            сохранения между запусками).
+# Обработчики и планировщик работают с движком через database/async_db.py.
+
+OPERATIONS = (
+    'init_db', 'close',
+    # Напоминания
+    'add_reminder', 'add_reminders', 'get_user_reminders', 'get_reminder_by_id', 'get_reminder_owner',
+    'update_reminder', 'toggle_reminder', 'delete_reminder', 'iter_reminders',
+    # Планировщик: выборка наступивших (next_fire_at <= now) и пакетные записи
+    'get_due_reminders', 'get_scheduled_reminders', 'claim_due_reminders',
+    'get_scheduler_state', 'set_scheduler_state',
+    'acquire_partitions', 'release_partitions',
+    # Журнал отправок
+    'finish_deliveries', 'get_pending_deliveries', 'get_deliveries', 'prune_deliveries',
+    # Пользователи
+    'get_user_timezone', 'set_user_timezone', 'get_user_digest', 'set_user_digest', 'reactivate_user',
+    'get_user_states', 'save_user_states',
+    # Обслуживание
+    'deactivate_completed', 'archive_reminders', 'incremental_vacuum',
+)
+
+ENGINES = {
+    'sqlite': 'database.db',
+    'memory': 'database.memory_db',
+}
+
+def load_engine(name):
+    if name not in ENGINES:
+        raise ValueError(f"Unknown database engine {name!r}, expected one of: {', '.join(ENGINES)}")
+    module = importlib.import_module(ENGINES[name])
+    missing = [operation for operation in OPERATIONS if not callable(getattr(module, operation, None))]
+    if missing:
+        raise TypeError(f"Database engine {name!r} does not implement: {', '.join(missing)}")
+    return module
+
+engine = load_engine(DATABASE_ENGINE)
@@ -0,0 +1,359 @@
+import argparse
+import csv
+import logging
+import os
+from datetime import datetime, timezone
+from .storage import engine as db
+from config import DATABASE_ENGINE
+from .recurrence import get_timezone, utc_now
+
+# Импорт и экспорт напоминаний в CSV и iCalendar (.ics). Файлы читаются
+# и пишутся построчно, а в базу строки уходят пачками, поэтому размер
+# файла на расход памяти не влияет. Из командной строки:
+#   python3 -m database.transfer export reminders.csv
+#   python3 -m database.transfer import --user 123456 calendar.ics
+
+FORMATS = ('csv', 'ics')
+REMINDER_TYPES = ('daily', 'weekly', 'monthly', 'yearly', 'once')
+CSV_COLUMNS = ['id', 'user_id', 'text', 'type', 'time', 'days_of_week', 'date', 'is_active']
+
+# Соответствие RRULE типам напоминаний; дни недели — как в days_of_week (1 — понедельник)
+_FREQ_TYPES = {'DAILY': 'daily', 'WEEKLY': 'weekly', 'MONTHLY': 'monthly', 'YEARLY': 'yearly'}
+_ICS_WEEKDAYS = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+# Время для событий «на весь день», у которых в календаре нет времени
+ALL_DAY_TIME = '09:00'
+
+def detect_format(filename):
+    extension = os.path.splitext(filename)[1].lower().lstrip('.')
+    if extension not in FORMATS:
+        raise ValueError(f"Неизвестный формат файла: {filename}")
+    return extension
+
+def normalize(user_id, text, reminder_type, time, days_of_week=None, date=None, is_active=True):
+    """Проверяет поля напоминания и приводит их к виду add_reminder; ValueError, если что-то не так."""
+    text = (text or '').strip()
+    if not text:
+        raise ValueError("пустой текст")
+    if reminder_type not in REMINDER_TYPES:
+        raise ValueError(f"неизвестный тип {reminder_type!r}")
+    time = datetime.strptime(time.strip(), '%H:%M').strftime('%H:%M')
+
+    if reminder_type == 'weekly':
+        days = sorted({int(day) for day in str(days_of_week or '').split(',') if day.strip()})
+        if not days or days[0] < 1 or days[-1] > 7:
+            raise ValueError(f"неверные дни недели {days_of_week!r}")
+        days_of_week = ','.join(map(str, days))
+    else:
+        days_of_week = None
+
+    if reminder_type in ('monthly', 'yearly', 'once'):
+        date = datetime.strptime((date or '').strip(), '%Y-%m-%d').strftime('%Y-%m-%d')
+    else:
+        date = None
+
+    return {
+        'user_id': int(user_id),
+        'text': text,
+        'reminder_type': reminder_type,
+        'time': time,
+        'days_of_week': days_of_week,
+        'date': date,
+        'is_active': is_active,
+    }
+
+def batches(reminders, batch_size):
+    """Делит итератор нормализованных словарей (None — пропущенная строка)
+    на пачки; выдаёт пары (пачка, пропущено строк с прошлой пачки)."""
+    batch, skipped = [], 0
+    for reminder in reminders:
+        if reminder is None:
+            skipped += 1
+            continue
+        batch.append(reminder)
+        if len(batch) >= batch_size:
+            yield batch, skipped
+            batch, skipped = [], 0
+    if batch or skipped:
+        yield batch, skipped
+
+def _import(reminders, batch_size):
+    imported = skipped = 0
+    for batch, batch_skipped in batches(reminders, batch_size):
+        skipped += batch_skipped
+        if batch:
+            imported += len(db.add_reminders(batch))
+    return imported, skipped
+
+# CSV
+
+def export_csv(out, user_id=None):
+    writer = csv.writer(out)
+    writer.writerow(CSV_COLUMNS)
+    count = 0
+    for reminder in db.iter_reminders(user_id):
+        writer.writerow([
+            reminder.id, reminder.user_id, reminder.text, reminder.reminder_type, reminder.time,
+            reminder.days_of_week, reminder.date or '', int(bool(reminder.is_active))
+        ])
+        count += 1
+    return count
+
+def _read_csv(stream, user_id):
+    for line_number, row in enumerate(csv.DictReader(stream), 2):
+        try:
+            yield normalize(
+                user_id if user_id is not None else row['user_id'],
+                row.get('text'), (row.get('type') or '').strip(), row.get('time') or '',
+                row.get('days_of_week'), row.get('date'),
+                (row.get('is_active') or '1').strip() not in ('0', 'false', 'False')
+            )
+        except (ValueError, KeyError, TypeError) as e:
+            logging.warning(f"CSV line {line_number} skipped: {e}")
+            yield None
+
+def import_csv(stream, user_id=None, batch_size=1000):
+    """Импорт CSV с колонками CSV_COLUMNS (id игнорируется).
+
+    Если user_id задан, все напоминания достаются ему, иначе берётся колонка
+    user_id. Возвращает (импортировано, пропущено).
+    """
+    return _import(_read_csv(stream, user_id), batch_size)
+
+# iCalendar
+
+def _escape_text(value):
+    return (value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+def _unescape_text(value):
+    result = []
+    chars = iter(value)
+    for char in chars:
+        if char == '\\':
+            char = next(chars, '')
+            result.append('\n' if char in 'nN' else char)
+        else:
+            result.append(char)
+    return ''.join(result)
+
+def _fold(line):
+    # Строки длиннее 75 байт переносятся с пробелом в начале продолжения (RFC 5545)
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    limit = 75
+    while len(encoded) > limit:
+        cut = limit
+        while cut and (encoded[cut] & 0xC0) == 0x80:  # не режем символ UTF-8 пополам
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+        limit = 74
+    parts.append(encoded.decode('utf-8'))
+    return '\r\n '.join(parts) + '\r\n'
+
+def _rrule(reminder):
+    if reminder.reminder_type == 'daily':
+        return 'FREQ=DAILY'
+    if reminder.reminder_type == 'weekly':
+        days = [_ICS_WEEKDAYS[int(day) - 1] for day in reminder.days_of_week.split(',')]
+        return 'FREQ=WEEKLY;BYDAY=' + ','.join(days)
+    if reminder.reminder_type == 'monthly':
+        return f'FREQ=MONTHLY;BYMONTHDAY={reminder.day}'
+    if reminder.reminder_type == 'yearly':
+        return f'FREQ=YEARLY;BYMONTH={reminder.month};BYMONTHDAY={reminder.day}'
+    return None
+
+def export_ics(out, user_id=None):
+    """Активные напоминания как события календаря; отключенные не выгружаются."""
+    stamp = utc_now().strftime('%Y%m%dT%H%M%SZ')
+    out.write('BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//reminder-bot//RU\r\n')
+    count = 0
+    for reminder in db.iter_reminders(user_id, active_only=True):
+        if reminder.minute_of_day is None:
+            continue
+        hour, minute = divmod(reminder.minute_of_day, 60)
+        if reminder.day:
+            start = datetime(reminder.year, reminder.month, reminder.day, hour, minute)
+        else:
+            # У ежедневных и еженедельных даты нет — начинаем с ближайшего срабатывания
+            next_fire = reminder.next_fire_datetime() or utc_now()
+            start = next_fire.astimezone(reminder.tz).replace(hour=hour, minute=minute, tzinfo=None)
+        lines = [
+            'BEGIN:VEVENT',
+            f'UID:reminder-{reminder.id}@reminder-bot',
+            f'DTSTAMP:{stamp}',
+            f'DTSTART;TZID={reminder.tz.key}:{start.strftime("%Y%m%dT%H%M%S")}',
+        ]
+        rrule = _rrule(reminder)
+        if rrule:
+            lines.append(f'RRULE:{rrule}')
+        lines += [
+            f'SUMMARY:{_escape_text(reminder.text)}',
+            f'X-REMINDER-USER:{reminder.user_id}',
+            'END:VEVENT',
+        ]
+        out.write(''.join(_fold(line) for line in lines))
+        count += 1
+    out.write('END:VCALENDAR\r\n')
+    return count
+
+def _unfolded_lines(stream):
+    line = None
+    for raw in stream:
+        raw = raw.rstrip('\r\n')
+        if raw[:1] in (' ', '\t') and line is not None:
+            line += raw[1:]
+            continue
+        if line is not None:
+            yield line
+        line = raw
+    if line:
+        yield line
+
+def _split_property(line):
+    # 'DTSTART;TZID=Europe/Moscow:20260101T090000' -> ('DTSTART', {'TZID': ...}, '20260101T090000')
+    quoted = False
+    for index, char in enumerate(line):
+        if char == '"':
+            quoted = not quoted
+        elif char == ':' and not quoted:
+            head, value = line[:index], line[index + 1:]
+            break
+    else:
+        return None, {}, None
+    name, *params = head.split(';')
+    parsed = {}
+    for param in params:
+        key, _, param_value = param.partition('=')
+        parsed[key.upper()] = param_value
+    return name.upper(), parsed, value
+
+def _event_to_reminder(event, user_id, owner_timezone):
+    if event.get('STATUS', (None, ''))[1].upper() == 'CANCELLED':
+        raise ValueError("отменённое событие")
+    owner = user_id if user_id is not None else event.get('X-REMINDER-USER', (None, None))[1]
+    if owner is None:
+        raise ValueError("не указан пользователь")
+    owner = int(owner)
+
+    params, value = event['DTSTART']
+    value = value.strip()
+    if len(value) == 8 or params.get('VALUE', '').upper() == 'DATE':
+        start = datetime.strptime(value[:8], '%Y%m%d')
+        time = ALL_DAY_TIME
+    else:
+        start = datetime.strptime(value.rstrip('Z')[:15], '%Y%m%dT%H%M%S')
+        # Время с поясом переводим в пояс владельца: напоминания хранят местное время
+        source = timezone.utc if value.endswith('Z') else (get_timezone(params['TZID'].strip('"')) if 'TZID' in params else None)
+        if source is not None:
+            start = start.replace(tzinfo=source).astimezone(owner_timezone(owner)).replace(tzinfo=None)
+        time = start.strftime('%H:%M')
+
+    rule = {}
+    if 'RRULE' in event:
+        rule = dict(part.split('=', 1) for part in event['RRULE'][1].upper().split(';') if '=' in part)
+    if not rule:
+        reminder_type = 'once'
+    else:
+        reminder_type = _FREQ_TYPES.get(rule.get('FREQ'))
+        unsupported = set(rule) - {'FREQ', 'BYDAY', 'BYMONTHDAY', 'BYMONTH', 'WKST', 'INTERVAL'}
+        if reminder_type is None or unsupported or rule.get('INTERVAL', '1') != '1':
+            raise ValueError(f"правило {event['RRULE'][1]!r} не поддерживается")
+        # Ежедневное по отдельным дням недели — это еженедельное с этими днями;
+        # «первый понедельник месяца» и т.п. напоминания выразить не могут
+        if 'BYDAY' in rule:
+            if reminder_type == 'daily':
+                reminder_type = 'weekly'
+            elif reminder_type != 'weekly':
+                raise ValueError(f"правило {event['RRULE'][1]!r} не поддерживается")
+
+    days_of_week = None
+    if reminder_type == 'weekly':
+        days = rule.get('BYDAY', _ICS_WEEKDAYS[start.weekday()]).split(',')
+        # Дни с номером (2TU, -1FR) не поддерживаются
+        if any(day not in _ICS_WEEKDAYS for day in days):
+            raise ValueError(f"правило {event['RRULE'][1]!r} не поддерживается")
+        days_of_week = ','.join(str(_ICS_WEEKDAYS.index(day) + 1) for day in days)
+
+    # Для ежемесячных и ежегодных число (и месяц) берём из правила, если указаны
+    date = start
+    if reminder_type in ('monthly', 'yearly') and 'BYMONTHDAY' in rule:
+        # Для ежемесячных важен только день; январь вмещает любое число
+        month = int(rule['BYMONTH']) if reminder_type == 'yearly' and 'BYMONTH' in rule else 1
+        date = date.replace(month=month, day=int(rule['BYMONTHDAY']))
+
+    return normalize(owner, _unescape_text(event.get('SUMMARY', (None, ''))[1]), reminder_type, time,
+                     days_of_week, date.strftime('%Y-%m-%d'))
+
+def _read_ics(stream, user_id):
+    timezones = {}
+
+    def owner_timezone(owner):
+        if owner not in timezones:
+            timezones[owner] = get_timezone(db.get_user_timezone(owner))
+        return timezones[owner]
+
+    event = None
+    for line in _unfolded_lines(stream):
+        name, params, value = _split_property(line)
+        if name == 'BEGIN' and value.upper() == 'VEVENT':
+            event = {}
+        elif name == 'END' and value.upper() == 'VEVENT' and event is not None:
+            try:
+                yield _event_to_reminder(event, user_id, owner_timezone)
+            except (ValueError, KeyError, TypeError) as e:
+                logging.warning(f"Calendar event {event.get('UID', (None, '?'))[1]} skipped: {e}")
+                yield None
+            event = None
+        elif event is not None and name and name not in event:
+            event[name] = (params, value)
+
+def import_ics(stream, user_id=None, batch_size=1000):
+    """Импорт событий календаря; RRULE переводится в тип напоминания.
+
+    Поддерживаются FREQ=DAILY/WEEKLY/MONTHLY/YEARLY без интервала и
+    ограничений (COUNT, UNTIL); события без RRULE становятся одноразовыми.
+    Владелец — user_id или X-REMINDER-USER из файла. Возвращает (импортировано, пропущено).
+    """
+    return _import(_read_ics(stream, user_id), batch_size)
+
+def export_file(path, file_format, user_id=None):
+    # newline='' — переводы строк пишут сами csv.writer и export_ics (CRLF)
+    with open(path, 'w', encoding='utf-8', newline='') as out:
+        return export_csv(out, user_id) if file_format == 'csv' else export_ics(out, user_id)
+
+def read_file(path, file_format, user_id=None):
+    # Нормализованные напоминания файла по одному (None — пропущенная строка);
+    # utf-8-sig: CSV из Excel начинается с BOM
+    with open(path, encoding='utf-8-sig', newline='') as stream:
+        yield from _read_csv(stream, user_id) if file_format == 'csv' else _read_ics(stream, user_id)
+
+def import_file(path, file_format, user_id=None, batch_size=1000):
+    return _import(read_file(path, file_format, user_id), batch_size)
+
+def main():
+    parser = argparse.ArgumentParser(description='Импорт и экспорт напоминаний в CSV и iCalendar')
+    parser.add_argument('action', choices=['import', 'export'])
+    parser.add_argument('file', help='файл .csv или .ics')
+    parser.add_argument('--format', choices=FORMATS, help='формат файла, по умолчанию по расширению')
+    parser.add_argument('--user', type=int,
+                        help='экспорт: только этого пользователя; импорт: все напоминания достаются ему')
+    parser.add_argument('--batch-size', type=int, default=1000, help='строк в одной транзакции при импорте')
+    args = parser.parse_args()
+    if DATABASE_ENGINE == 'memory':
+        parser.error("с DATABASE_ENGINE = 'memory' данные есть только внутри процесса бота, используйте /import и /export")
+
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
+    db.init_db()
+    file_format = args.format or detect_format(args.file)
+    if args.action == 'export':
+        count = export_file(args.file, file_format, args.user)
+        logging.info(f"Exported {count} reminders to {args.file}")
+    else:
+        imported, skipped = import_file(args.file, file_format, args.user, args.batch_size)
+        logging.info(f"Imported {imported} reminders from {args.file}, skipped {skipped}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+from database.async_db import get_user_reminders, add_invalidation_listener
+from database.cache import LRUCache, MISSING
+from keyboards.inline_keyboards import get_reminder_list_keyboard
+from config import LIST_PAGE_SIZE, LIST_CACHE_SIZE, LIST_CACHE_TTL
+
+TYPE_ICONS = {
+    'daily': '🔄 ежедневно',
+    'weekly': '🔄 по дням',
+    'monthly': '🔄 ежемесячно',
+    'yearly': '🔄 ежегодно',
+    'once': '📅 один раз',
+}
+
+class _UserList:
+    __slots__ = ('entries', 'pages')
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.pages = {}
+
+# Отрисованные страницы списка по пользователям; сбрасываются вместе с кэшем
+# напоминаний в database/async_db при любой записи и по LIST_CACHE_TTL
+_cache = LRUCache('list_pages', LIST_CACHE_SIZE, LIST_CACHE_TTL)
+
+def invalidate(user_id):
+    if user_id is None:
+        _cache.clear()
+    else:
+        _cache.pop(user_id)
+
+add_invalidation_listener(invalidate)
+
+def _format_entry(number, reminder):
+    text = reminder.text if len(reminder.text) <= 40 else reminder.text[:39] + '…'
+    kind = TYPE_ICONS.get(reminder.reminder_type, '')
+    if reminder.reminder_type == 'weekly':
+        kind = f"🔄 {', '.join(reminder.weekday_names())}"
+    elif reminder.reminder_type == 'monthly' and reminder.day:
+        kind += f" ({reminder.day}-го)"
+    elif reminder.reminder_type == 'yearly' and reminder.day:
+        kind += f" ({reminder.day:02d}.{reminder.month:02d})"
+    elif reminder.reminder_type == 'once' and reminder.day:
+        kind += f" ({reminder.day:02d}.{reminder.month:02d}.{reminder.year})"
+    return f"{number}. ⏰ {reminder.time} {kind}\n    📝 {text}"
+
+async def _load(user_id):
+    cached = _cache.get(user_id)
+    if cached is not MISSING:
+        return cached
+
+    version = _cache.version()
+    reminders = await get_user_reminders(user_id)
+    cached = _UserList([
+        (reminder.id, _format_entry(number, reminder))
+        for number, reminder in enumerate(reminders, 1)
+    ])
+    _cache.set(user_id, cached, version)
+    return cached
+
+async def render_page(user_id, page=0):
+    """Текст и клавиатура страницы списка; (None, None), если напоминаний нет."""
+    cached = await _load(user_id)
+    if not cached.entries:
+        return None, None
+
+    pages = -(-len(cached.entries) // LIST_PAGE_SIZE)
+    page = min(max(page, 0), pages - 1)
+    if page not in cached.pages:
+        start = page * LIST_PAGE_SIZE
+        entries = cached.entries[start:start + LIST_PAGE_SIZE]
+        text = f"📋 Ваши напоминания ({len(cached.entries)}):\n\n" + "\n".join(line for _, line in entries)
+        keyboard = get_reminder_list_keyboard(
+            [(start + number, reminder_id) for number, (reminder_id, _) in enumerate(entries, 1)],
+            page, pages
+        )
+        cached.pages[page] = (text, keyboard)
+    return cached.pages[page]
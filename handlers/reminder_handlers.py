@@ -1,14 +1,29 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from datetime import datetime, timedelta
-from database.db import (
-    add_reminder, get_user_reminders, delete_reminder, 
-    get_reminder_by_id, update_reminder, toggle_reminder
+from database.async_db import (
+    add_reminder, delete_reminder, 
+    get_reminder_by_id, update_reminder, toggle_reminder,
+    get_user_timezone, set_user_timezone, get_user_digest, set_user_digest,
+    reactivate_user
+)
+from database.recurrence import get_timezone, is_valid_timezone, utc_now
+from database.models import WEEKDAY_NAMES
+from handlers import list_view
+from keyboards.inline_keyboards import (
+    get_reminder_type_keyboard, get_weekdays_keyboard, get_reminder_management_keyboard,
+    get_timezone_keyboard
 )
-from keyboards.inline_keyboards import get_reminder_type_keyboard, get_weekdays_keyboard, get_reminder_management_keyboard
 from keyboards.reply_keyboards import get_main_keyboard
 from telegram.error import BadRequest
 
+async def reminders_changed(context: ContextTypes.DEFAULT_TYPE, user_id: int, *reminder_ids: int):
+    # Кэши сбрасывает сама запись (database/async_db); планировщику сообщаем
+    # об изменении, чтобы он не ждал перечитывания базы
+    scheduler = context.bot_data.get('scheduler')
+    if scheduler and reminder_ids:
+        await scheduler.reschedule(*reminder_ids)
+
 async def delete_message(context: ContextTypes.DEFAULT_TYPE, chat_id: int, message_id: int):
     try:
         await context.bot.delete_message(chat_id=chat_id, message_id=message_id)
@@ -16,6 +31,12 @@ async def delete_message(context: ContextTypes.DEFAULT_TYPE, chat_id: int, messa
         pass
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Если напоминания были приостановлены (бот был заблокирован), /start их возобновляет
+    user_id = update.effective_user.id
+    reminder_ids = await reactivate_user(user_id)
+    if reminder_ids is not None:
+        await reminders_changed(context, user_id, *reminder_ids)
+    
     await update.message.reply_text(
         "Привет! Я бот для напоминаний.\n\n"
         "Я помогу вам не забыть о важных делах и событиях.\n"
@@ -34,6 +55,10 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "📌 *Основные команды:*\n"
         "/new или 📝 Новое напоминание - создать напоминание\n"
         "/list или 📋 Мои напоминания - список ваших напоминаний\n"
+        "/timezone - выбрать часовой пояс\n"
+        "/digest [on|off] - присылать одновременные напоминания одним сообщением\n"
+        "/export [csv|ics] - выгрузить напоминания в файл\n"
+        "/import - загрузить напоминания из файла .csv или .ics\n"
         "/help или ℹ️ Помощь - показать это сообщение\n\n"
         "*Типы напоминаний:*\n"
         "• Ежедневные - каждый день в указанное время\n"
@@ -60,10 +85,10 @@ async def new_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     context.user_data['last_bot_message'] = message.message_id
 
-def validate_date(date_str):
+def validate_date(date_str, tz):
     try:
         date = datetime.strptime(date_str, '%d.%m.%Y')
-        current_date = datetime.now()
+        current_date = datetime.now(tz).replace(tzinfo=None)
         
         # Убираем время для корректного сравнения дат
         current_date = current_date.replace(hour=0, minute=0, second=0, microsecond=0)
@@ -75,37 +100,87 @@ def validate_date(date_str):
     except ValueError:
         return False, "Неверный формат даты!"
 
+def format_reminder(reminder, now):
+    status = "🔔 Активно" if reminder.is_active else "🔕 Отключено"
+    reminder_text = f"📝 {reminder.text}\n⏰ {reminder.time}\n{status}\n"
+    
+    if reminder.reminder_type == 'daily':
+        reminder_text += "🔄 Ежедневно"
+    elif reminder.reminder_type == 'weekly':
+        reminder_text += f"🔄 Еженедельно ({', '.join(reminder.weekday_names())})"
+    elif reminder.reminder_type == 'monthly':
+        reminder_text += f"🔄 Ежемесячно ({reminder.date})"
+    elif reminder.reminder_type == 'yearly':
+        reminder_text += f"🔄 Ежегодно ({reminder.date})"
+    else:
+        reminder_text += f"📅 Одноразово ({reminder.date})"
+    
+    next_time = reminder.next_occurrence(now) if reminder.is_active else None
+    if next_time:
+        reminder_text += f"\n⏭ Следующее: {next_time.astimezone(reminder.tz).strftime('%d.%m.%Y %H:%M')}"
+    return reminder_text
+
+async def apply_timezone(context: ContextTypes.DEFAULT_TYPE, user_id: int, timezone: str):
+    reminder_ids = await set_user_timezone(user_id, timezone)
+    await reminders_changed(context, user_id, *reminder_ids)
+
+async def timezone_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # /timezone Europe/Moscow — любой пояс из базы IANA; без аргумента — выбор из списка
+    if context.args:
+        timezone = context.args[0]
+        if not is_valid_timezone(timezone):
+            await update.message.reply_text("❌ Неизвестный часовой пояс. Пример: /timezone Europe/Moscow")
+            return
+        await apply_timezone(context, update.effective_user.id, timezone)
+        await update.message.reply_text(f"✅ Часовой пояс: {timezone}")
+        return
+    
+    current = await get_user_timezone(update.effective_user.id)
+    await update.message.reply_text(
+        f"Текущий часовой пояс: {current}\n"
+        "Выберите свой или отправьте /timezone <пояс>, например /timezone Asia/Tbilisi",
+        reply_markup=get_timezone_keyboard()
+    )
+
+async def digest_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # /digest on|off; без аргумента — переключить
+    user_id = update.effective_user.id
+    arg = context.args[0].lower() if context.args else None
+    if arg in ('on', 'off'):
+        enabled = arg == 'on'
+    elif arg is None:
+        enabled = not await get_user_digest(user_id)
+    else:
+        await update.message.reply_text("❌ Используйте /digest on или /digest off")
+        return
+    
+    await set_user_digest(user_id, enabled)
+    if enabled:
+        await update.message.reply_text("✅ Напоминания, сработавшие одновременно, будут приходить одним сообщением")
+    else:
+        await update.message.reply_text("✅ Каждое напоминание будет приходить отдельным сообщением")
+
 async def list_reminders(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    reminders = get_user_reminders(update.effective_user.id)
+    # Весь список — одно сообщение со страницами, а не сообщение на каждое напоминание
+    text, keyboard = await list_view.render_page(update.effective_user.id)
     
-    if not reminders:
-        await update.message.reply_text("У вас нет активных напоминаний.")
+    if text is None:
+        await update.effective_message.reply_text("У вас нет активных напоминаний.")
         return
+    
+    await update.effective_message.reply_text(text, reply_markup=keyboard)
 
-    for reminder in reminders:
-        reminder_id, user_id, text, reminder_type, days_of_week, time, date, is_active, last_reminded = reminder
-        
-        status = "🔔 Активно" if is_active else "🔕 Отключено"
-        reminder_text = f"📝 {text}\n⏰ {time}\n{status}\n"
-        
-        if reminder_type == 'daily':
-            reminder_text += "🔄 Ежедневно"
-        elif reminder_type == 'weekly':
-            days = days_of_week.split(',')
-            days_text = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
-            selected_days = [days_text[int(d)-1] for d in days]
-            reminder_text += f"🔄 Еженедельно ({', '.join(selected_days)})"
-        elif reminder_type == 'monthly':
-            reminder_text += f"🔄 Ежемесячно ({date})"
-        elif reminder_type == 'yearly':
-            reminder_text += f"🔄 Ежегодно ({date})"
-        else:
-            reminder_text += f"📅 Одноразово ({date})"
-        
-        await update.message.reply_text(
-            reminder_text,
-            reply_markup=get_reminder_management_keyboard(reminder_id, is_active)
-        )
+async def show_list_page(query, user_id: int, page: int):
+    text, keyboard = await list_view.render_page(user_id, page)
+    if text is None:
+        await query.message.edit_text("У вас нет активных напоминаний.")
+        return
+    try:
+        await query.message.edit_text(text, reply_markup=keyboard)
+    except BadRequest as e:
+        # Повторное нажатие на ту же страницу — сообщение не изменилось
+        if 'not modified' not in str(e):
+            raise
 
 async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = update.message.text
@@ -130,7 +205,8 @@ async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
         edit_type = context.user_data['edit_type']
         
         if edit_type == 'text':
-            update_reminder(reminder_id, text=update.message.text)
+            await update_reminder(reminder_id, text=update.message.text)
+            await reminders_changed(context, update.effective_user.id, reminder_id)
             message = await update.message.reply_text("✅ Текст напоминания обновлен!")
             context.user_data['last_bot_message'] = message.message_id
         
@@ -161,7 +237,8 @@ async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data['last_bot_message'] = message.message_id
     
     elif context.user_data['waiting_for'] == 'date':
-        is_valid, result = validate_date(update.message.text)
+        tz = get_timezone(await get_user_timezone(update.effective_user.id))
+        is_valid, result = validate_date(update.message.text, tz)
         if not is_valid:
             message = await update.message.reply_text(f"❌ {result}")
             context.user_data['last_bot_message'] = message.message_id
@@ -178,7 +255,7 @@ async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
             context.user_data['time'] = time.strftime('%H:%M')
             
             # Сохраняем напоминание
-            reminder_id = add_reminder(
+            reminder_id = await add_reminder(
                 user_id=update.effective_user.id,
                 text=context.user_data['text'],
                 reminder_type=context.user_data['reminder_type'],
@@ -186,6 +263,7 @@ async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 time=context.user_data['time'],
                 date=context.user_data.get('date')
             )
+            await reminders_changed(context, update.effective_user.id, reminder_id)
             
             message = await update.message.reply_text("✅ Напоминание успешно создано!")
             context.user_data['last_bot_message'] = message.message_id
@@ -213,7 +291,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     elif query.data.startswith("edit_"):
         _, edit_type, reminder_id = query.data.split("_")
-        reminder = get_reminder_by_id(int(reminder_id))
+        reminder = await get_reminder_by_id(int(reminder_id))
         
         if not reminder:
             await query.message.edit_text("❌ Напоминание не найдено!")
@@ -229,13 +307,41 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         elif edit_type == 'date':
             await query.message.edit_text("Введите новую дату в формате ДД.ММ.ГГГГ:")
         context.user_data['last_bot_message'] = query.message.message_id
+    elif query.data.startswith("tz_"):
+        timezone = query.data[3:]
+        # callback_data присылает клиент — проверяем, как и в /timezone
+        if not is_valid_timezone(timezone):
+            await query.message.edit_text("❌ Неизвестный часовой пояс. Пример: /timezone Europe/Moscow")
+            return
+        await apply_timezone(context, update.effective_user.id, timezone)
+        await query.message.edit_text(f"✅ Часовой пояс: {timezone}")
+    
+    elif query.data.startswith("list_"):
+        await show_list_page(query, update.effective_user.id, int(query.data.split("_")[1]))
+    
+    elif query.data.startswith("manage_"):
+        _, reminder_id, page = query.data.split("_")
+        reminder = await get_reminder_by_id(int(reminder_id))
+        
+        if not reminder or reminder.user_id != update.effective_user.id or not reminder.is_active:
+            await show_list_page(query, update.effective_user.id, int(page))
+            return
+        
+        await query.message.edit_text(
+            format_reminder(reminder, utc_now()),
+            reply_markup=get_reminder_management_keyboard(reminder.id, reminder.is_active, int(page))
+        )
+    
     elif query.data.startswith("toggle_"):
-        reminder_id = int(query.data.split("_")[1])
-        new_status = toggle_reminder(reminder_id)
+        parts = query.data.split("_")
+        reminder_id = int(parts[1])
+        page = int(parts[2]) if len(parts) > 2 else 0
+        new_status = await toggle_reminder(reminder_id)
+        await reminders_changed(context, update.effective_user.id, reminder_id)
         status_text = "включено" if new_status else "отключено"
         await query.message.edit_text(
             f"Напоминание {status_text}!",
-            reply_markup=get_reminder_management_keyboard(reminder_id, new_status)
+            reply_markup=get_reminder_management_keyboard(reminder_id, new_status, page)
         )
 
     elif query.data.startswith("day_"):
@@ -249,8 +355,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             context.user_data['selected_days'].append(day)
         
         # Обновляем сообщение с выбранными днями
-        days_text = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
-        selected = [days_text[int(d)-1] for d in context.user_data['selected_days']]
+        selected = [WEEKDAY_NAMES[int(d)-1] for d in context.user_data['selected_days']]
         await query.message.edit_text(
             f"Выбранные дни: {', '.join(selected) if selected else 'нет'}\n"
             "Выберите дни недели:",
@@ -267,6 +372,12 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data['waiting_for'] = 'time'
     
     elif query.data.startswith("delete_"):
-        reminder_id = int(query.data.split("_")[1])
-        delete_reminder(reminder_id)
-        await query.message.edit_text("Напоминание удалено!")
\ No newline at end of file
+        parts = query.data.split("_")
+        reminder_id = int(parts[1])
+        await delete_reminder(reminder_id)
+        await reminders_changed(context, update.effective_user.id, reminder_id)
+        if len(parts) > 2:
+            # Удалили из списка — возвращаемся на ту же страницу
+            await show_list_page(query, update.effective_user.id, int(parts[2]))
+        else:
+            await query.message.edit_text("Напоминание удалено!")
\ No newline at end of file
@@ -0,0 +1,104 @@
+import asyncio
+import os
+import tempfile
+from telegram import Update
+from telegram.ext import ContextTypes
+from database import async_db, transfer
+from config import ADMIN_IDS
+
+# Больше Telegram не даёт скачать боту; такие файлы — через python3 -m database.transfer
+MAX_IMPORT_FILE_SIZE = 20 * 1024 * 1024
+# Строк в одной транзакции импорта; между пачками проходят записи обработчиков и планировщика
+IMPORT_BATCH_SIZE = 500
+
+def _parse_args(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # /export [csv|ics] [all] — «all» (все пользователи) доступно только администраторам
+    args = [arg.lower() for arg in context.args or []]
+    everyone = 'all' in args
+    if everyone and update.effective_user.id not in ADMIN_IDS:
+        return None, None
+    file_format = next((arg for arg in args if arg in transfer.FORMATS), 'csv')
+    return file_format, None if everyone else update.effective_user.id
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    file_format, user_id = _parse_args(update, context)
+    if file_format is None:
+        await update.message.reply_text("❌ Выгрузка всех напоминаний доступна только администратору")
+        return
+
+    # Файл пишется на диск построчно в отдельном потоке и только потом отправляется
+    descriptor, path = tempfile.mkstemp(suffix=f'.{file_format}')
+    os.close(descriptor)
+    try:
+        count = await asyncio.to_thread(transfer.export_file, path, file_format, user_id)
+        if not count:
+            await update.message.reply_text("У вас нет напоминаний для выгрузки")
+            return
+        with open(path, 'rb') as document:
+            await update.message.reply_document(
+                document, filename=f'reminders.{file_format}', caption=f"📤 Напоминаний: {count}"
+            )
+    finally:
+        os.remove(path)
+
+async def import_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    file_format, user_id = _parse_args(update, context)
+    if file_format is None:
+        await update.message.reply_text("❌ Импорт для других пользователей доступен только администратору")
+        return
+
+    context.user_data['import_all'] = user_id is None
+    await update.message.reply_text(
+        "📥 Отправьте файл .csv или .ics.\n"
+        f"CSV: колонки {', '.join(transfer.CSV_COLUMNS)}; "
+        "в .ics повторение событий (RRULE) переводится в тип напоминания."
+    )
+
+async def _import_file(path, file_format, user_id):
+    # Файл разбирается в отдельном потоке, а пачки пишутся через общий поток
+    # записи database/async_db — так же, как любые другие изменения, со сбросом
+    # кэшей. Возвращает (id новых напоминаний, пропущено строк)
+    reminder_batches = transfer.batches(transfer.read_file(path, file_format, user_id), IMPORT_BATCH_SIZE)
+    reminder_ids, skipped = [], 0
+    while True:
+        result = await asyncio.to_thread(next, reminder_batches, None)
+        if result is None:
+            return reminder_ids, skipped
+        batch, batch_skipped = result
+        skipped += batch_skipped
+        if batch:
+            reminder_ids += await async_db.add_reminders(batch)
+
+async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if 'import_all' not in context.user_data:
+        return
+    import_all = context.user_data.pop('import_all')
+    document = update.message.document
+
+    try:
+        file_format = transfer.detect_format(document.file_name or '')
+    except ValueError:
+        await update.message.reply_text("❌ Поддерживаются только файлы .csv и .ics")
+        return
+    if document.file_size and document.file_size > MAX_IMPORT_FILE_SIZE:
+        await update.message.reply_text("❌ Файл слишком большой, импортируйте его через командную строку")
+        return
+
+    descriptor, path = tempfile.mkstemp(suffix=f'.{file_format}')
+    os.close(descriptor)
+    try:
+        telegram_file = await document.get_file()
+        await telegram_file.download_to_drive(path)
+        reminder_ids, skipped = await _import_file(path, file_format, None if import_all else update.effective_user.id)
+    finally:
+        os.remove(path)
+
+    # Планировщику — только новые напоминания, без перечитывания всего расписания
+    scheduler = context.bot_data.get('scheduler')
+    if scheduler and reminder_ids:
+        await scheduler.reschedule(*reminder_ids)
+
+    text = f"✅ Импортировано напоминаний: {len(reminder_ids)}"
+    if skipped:
+        text += f"\n⚠️ Пропущено строк с ошибками: {skipped}"
+    await update.message.reply_text(text)
@@ -0,0 +1,161 @@
+import asyncio
+import hmac
+import json
+import logging
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# Приём обновлений от Telegram по webhook без внешнего веб-сервера.
+# Обновление кладётся в application.update_queue и сразу подтверждается,
+# а обработка идёт параллельно (см. CONCURRENT_UPDATES в config.py), но
+# обновления одного пользователя — по очереди (PerUserUpdateProcessor).
+# Проверить локально можно, отправив сохранённое обновление:
+#   curl -H 'X-Telegram-Bot-Api-Secret-Token: <secret>' -d @update.json http://127.0.0.1:8443/telegram
+
+MAX_BODY_SIZE = 1024 * 1024
+# Сколько ждать следующего запроса по открытому соединению; потом закрываем
+IDLE_TIMEOUT = 60
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+
+_STATUS = {
+    200: 'OK',
+    400: 'Bad Request',
+    403: 'Forbidden',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+}
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Обрабатывает до max_concurrent_updates обновлений одновременно, но
+    обновления одного пользователя — строго по очереди: диалоги в
+    context.user_data не рассчитаны на параллельную обработку.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        # user_id -> [блокировка, сколько обновлений её ждут или держат]
+        self._locks = {}
+
+    async def process_update(self, update, coroutine):
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is None:
+            await super().process_update(update, coroutine)
+            return
+        # Сначала очередь пользователя, потом общий лимит: ждущие своей
+        # очереди обновления не занимают места других пользователей
+        entry = self._locks.setdefault(user.id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await super().process_update(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[user.id]
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+class WebhookServer:
+    def __init__(self, application, host, port, path, secret_token=None):
+        self._application = application
+        self._host = host
+        self._port = port
+        self._path = path
+        self._secret_token = secret_token.encode() if secret_token else None
+        self._server = None
+        self._writers = set()
+
+    async def start(self):
+        if not self._secret_token:
+            logging.warning("Webhook secret token is not set, any client can post updates")
+        self._server = await asyncio.start_server(self._handle, self._host, self._port)
+        logging.info(f"Listening for webhook updates at http://{self._host}:{self._port}{self._path}")
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            # Начиная с Python 3.12 wait_closed ждёт и открытые соединения,
+            # а Telegram держит их сколько угодно — закрываем сами
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader, writer):
+        # Telegram держит соединение открытым и шлёт по нему обновления подряд
+        self._writers.add(writer)
+        try:
+            keep_alive = True
+            while keep_alive:
+                status, keep_alive = await self._handle_request(reader)
+                if status is None:
+                    break
+                writer.write(
+                    f'HTTP/1.1 {status} {_STATUS[status]}\r\n'
+                    f'Content-Length: 0\r\n'
+                    f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode()
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _handle_request(self, reader):
+        """Возвращает (HTTP-статус, оставить ли соединение); статус None — клиент ушёл."""
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), IDLE_TIMEOUT)
+        except asyncio.IncompleteReadError as e:
+            if not e.partial:
+                return None, False
+            raise
+
+        request_line, *header_lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, version = request_line.split(' ')
+        except ValueError:
+            return 400, False
+        headers = {}
+        for line in header_lines:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+
+        # Тело, которое мы не читаем (chunked), иначе разобралось бы как следующий запрос
+        if 'transfer-encoding' in headers:
+            return 400, False
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            return 400, False
+        if length < 0:
+            return 400, False
+        if length > MAX_BODY_SIZE:
+            return 413, False
+        body = await asyncio.wait_for(reader.readexactly(length), IDLE_TIMEOUT) if length else b''
+
+        if target.split('?')[0] != self._path:
+            return 404, keep_alive
+        if method != 'POST':
+            return 405, keep_alive
+        if self._secret_token and not hmac.compare_digest(
+                headers.get(SECRET_HEADER, '').encode(), self._secret_token):
+            return 403, keep_alive
+
+        try:
+            update = Update.de_json(json.loads(body), self._application.bot)
+        except Exception as e:
+            logging.error(f"Invalid webhook update: {e}")
+            return 400, keep_alive
+        await self._application.update_queue.put(update)
+        return 200, keep_alive
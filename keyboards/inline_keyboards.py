@@ -37,7 +37,7 @@ def get_weekdays_keyboard():
     ]
     return InlineKeyboardMarkup(keyboard)
 
-def get_reminder_management_keyboard(reminder_id, is_active):
+def get_reminder_management_keyboard(reminder_id, is_active, page=0):
     keyboard = [
         [
             InlineKeyboardButton("✏️ Изменить текст", callback_data=f"edit_text_{reminder_id}"),
@@ -45,13 +45,58 @@ def get_reminder_management_keyboard(reminder_id, is_active):
         ],
         [
             InlineKeyboardButton("📅 Изменить дату", callback_data=f"edit_date_{reminder_id}"),
-            InlineKeyboardButton("❌ Удалить", callback_data=f"delete_{reminder_id}")
+            InlineKeyboardButton("❌ Удалить", callback_data=f"delete_{reminder_id}_{page}")
         ],
         [
             InlineKeyboardButton(
                 "🔕 Отключить" if is_active else "🔔 Включить", 
-                callback_data=f"toggle_{reminder_id}"
+                callback_data=f"toggle_{reminder_id}_{page}"
             )
+        ],
+        [
+            InlineKeyboardButton("⬅️ К списку", callback_data=f"list_{page}")
         ]
     ]
-    return InlineKeyboardMarkup(keyboard) 
\ No newline at end of file
+    return InlineKeyboardMarkup(keyboard)
+
+def get_reminder_list_keyboard(entries, page, pages):
+    # entries — пары (номер в списке, id напоминания) для текущей страницы
+    keyboard = []
+    row = []
+    for number, reminder_id in entries:
+        row.append(InlineKeyboardButton(f"⚙️ {number}", callback_data=f"manage_{reminder_id}_{page}"))
+        if len(row) == 5:
+            keyboard.append(row)
+            row = []
+    if row:
+        keyboard.append(row)
+    
+    if pages > 1:
+        keyboard.append([
+            InlineKeyboardButton("◀️", callback_data=f"list_{(page - 1) % pages}"),
+            InlineKeyboardButton(f"{page + 1}/{pages}", callback_data=f"list_{page}"),
+            InlineKeyboardButton("▶️", callback_data=f"list_{(page + 1) % pages}")
+        ])
+    return InlineKeyboardMarkup(keyboard)
+
+# Часовые пояса России — от Калининграда до Камчатки
+TIMEZONES = [
+    ("Калининград (UTC+2)", "Europe/Kaliningrad"),
+    ("Москва (UTC+3)", "Europe/Moscow"),
+    ("Самара (UTC+4)", "Europe/Samara"),
+    ("Екатеринбург (UTC+5)", "Asia/Yekaterinburg"),
+    ("Омск (UTC+6)", "Asia/Omsk"),
+    ("Красноярск (UTC+7)", "Asia/Krasnoyarsk"),
+    ("Иркутск (UTC+8)", "Asia/Irkutsk"),
+    ("Якутск (UTC+9)", "Asia/Yakutsk"),
+    ("Владивосток (UTC+10)", "Asia/Vladivostok"),
+    ("Магадан (UTC+11)", "Asia/Magadan"),
+    ("Камчатка (UTC+12)", "Asia/Kamchatka"),
+]
+
+def get_timezone_keyboard():
+    keyboard = [
+        [InlineKeyboardButton(title, callback_data=f"tz_{name}")]
+        for title, name in TIMEZONES
+    ]
+    return InlineKeyboardMarkup(keyboard)
@@ -1,17 +1,45 @@
+import argparse
+import asyncio
 import logging
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters
+import os
+import signal
+import socket
+import time
+from telegram.ext import Application, CallbackContext, CommandHandler, CallbackQueryHandler, MessageHandler, filters
 from telegram import BotCommand
 from handlers.reminder_handlers import (
     start, help_command, new_reminder, list_reminders,
-    button_callback, handle_text_input
+    button_callback, handle_text_input, timezone_command, digest_command
 )
-from database.db import init_db, get_active_reminders, update_last_reminded
-from config import TELEGRAM_TOKEN
-from datetime import datetime
+from handlers.transfer_handlers import export_command, import_command, handle_document
+from database.storage import engine as storage
+from database import async_db
+from database.persistence import SQLitePersistence
+from handlers.webhook import WebhookServer, PerUserUpdateProcessor
+from database.recurrence import format_next_fire, utc_now
+from database.models import partition_of
+from scheduler.reminder_scheduler import ReminderScheduler
+from scheduler.delivery import DeliveryQueue
+from scheduler.digest import enqueue_reminders
+from scheduler.leases import PartitionLeases
+from scheduler.maintenance import Maintenance
+from monitoring import metrics
+from config import (
+    TELEGRAM_TOKEN, DELIVERY_WORKERS, DELIVERY_GLOBAL_RATE, DELIVERY_CHAT_INTERVAL,
+    DELIVERY_MAX_ATTEMPTS, DELIVERY_RETRY_BASE_DELAY, DELIVERY_HISTORY_DAYS, DIGEST_MAX_LENGTH,
+    SCHEDULER_MAX_CATCHUP_MINUTES,
+    WORKER_PARTITIONING, WORKER_ID, WORKER_PARTITION_COUNT, WORKER_LEASE_TTL,
+    WORKER_LEASE_RENEW_INTERVAL, WORKER_RESYNC_INTERVAL, LOG_LEVEL, METRICS_HOST, METRICS_PORT,
+    PERSISTENCE_UPDATE_INTERVAL, PERSISTENCE_STATE_TTL, MAINTENANCE_INTERVAL, MAINTENANCE_BATCH_SIZE,
+    MAINTENANCE_ARCHIVE_AFTER_DAYS, MAINTENANCE_VACUUM_PAGES, UPDATE_MODE, CONCURRENT_UPDATES,
+    WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET_TOKEN, WEBHOOK_MAX_CONNECTIONS,
+    DATABASE_ENGINE
+)
+from datetime import timedelta
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+    level=LOG_LEVEL
 )
 
 async def setup_commands(application: Application):
@@ -19,82 +47,342 @@ async def setup_commands(application: Application):
         BotCommand("start", "Запустить бота"),
         BotCommand("new", "Создать новое напоминание"),
         BotCommand("list", "Показать мои напоминания"),
+        BotCommand("timezone", "Выбрать часовой пояс"),
+        BotCommand("digest", "Объединять одновременные напоминания в одно сообщение"),
+        BotCommand("export", "Выгрузить напоминания (CSV или ICS)"),
+        BotCommand("import", "Загрузить напоминания из файла"),
         BotCommand("help", "Показать помощь")
     ]
     await application.bot.set_my_commands(commands)
 
+def timed_handler(callback):
+    return metrics.timed(metrics.HANDLER_DURATION, handler=callback.__name__)(callback)
+
+def high_water_key(partition=None):
+    return 'high_water' if partition is None else f'high_water:{partition}'
+
 async def check_reminders(context):
-    now = datetime.now()
-    current_time = now.strftime("%H:%M")
-    current_date = now.strftime("%Y-%m-%d")
-    weekday = str(now.isoweekday())
+    started = time.perf_counter()
+    now = utc_now()
+    now_timestamp = format_next_fire(now)
+    # Построчная трассировка включается через LOG_LEVEL = 'DEBUG'
+    trace = logging.getLogger().isEnabledFor(logging.DEBUG)
     
-    logging.info(f"Checking reminders at {current_time}")
+    if trace:
+        logging.debug(f"Checking reminders at {now.strftime('%H:%M')} UTC")
     
-    reminders = get_active_reminders()
+    delivery = context.bot_data['delivery']
+    leases = context.bot_data.get('leases')
     
+    # Из базы приходят только напоминания, время которых уже наступило;
+    # в режиме нескольких процессов — только из наших партиций. Набор партиций
+    # берём один раз: аренда может смениться, пока идёт запрос, и отметка
+    # продвинулась бы для партиции, напоминания которой мы не выбирали
+    if leases:
+        partitions = leases.partitions
+        reminders = await async_db.get_due_reminders(now, partitions, leases.partition_count)
+        keys = [high_water_key(partition) for partition in partitions]
+    else:
+        reminders = await async_db.get_due_reminders(now)
+        keys = [high_water_key()]
+    
+    # Обрабатываем окно (последний обработанный момент, now], но не глубже
+    # SCHEDULER_MAX_CATCHUP_MINUTES — так опоздавший tick ничего не теряет
+    horizon = format_next_fire(now - timedelta(minutes=SCHEDULER_MAX_CATCHUP_MINUTES))
+    high_water = await async_db.get_scheduler_state(keys)
+    
+    messages = {}
     for reminder in reminders:
-        reminder_id, user_id, text, reminder_type, days_of_week, time, date, is_active, last_reminded = reminder
+        if trace:
+            logging.debug(f"Checking reminder {reminder.id}: next_fire_at={reminder.next_fire_at}, now={now_timestamp}")
         
-        logging.info(f"Checking reminder {reminder_id}: time={time}, current_time={current_time}")
+        partition = partition_of(reminder.user_id, leases.partition_count) if leases else None
+        window_start = max(horizon, int(high_water.get(high_water_key(partition)) or horizon))
+        if reminder.next_fire_at <= window_start:
+            continue
+        
+        body = reminder.text
+        if now_timestamp - reminder.next_fire_at >= 60:
+            body += f"\n\n⏱ Должно было сработать в {reminder.time}"
+        messages[reminder.id] = body
+    
+    # Сдвигаем напоминания до отправки одной транзакцией. Сдвиг служит захватом:
+    # если другой процесс успел раньше, напоминание достанется ему. В той же
+    # транзакции отправки записываются в журнал deliveries, поэтому после сбоя
+    # срабатывание не теряется и не отправляется повторно
+    claimed = set(await async_db.claim_due_reminders(reminders, messages=messages,
+                                                     worker_id=leases.worker_id if leases else None))
+    lag = 0
+    entries = []
+    
+    for reminder in reminders:
+        if reminder.id not in claimed:
+            continue
         
-        if time != current_time:
+        if reminder.id not in messages:
+            logging.warning(f"Reminder {reminder.id} due at {reminder.next_fire_at} is outside the catch-up window, skipped")
+            metrics.REMINDERS_SKIPPED.inc()
             continue
-            
-        should_remind = False
         
-        if reminder_type == 'daily':
-            should_remind = True
-        elif reminder_type == 'weekly':
-            if days_of_week and weekday in days_of_week.split(','):
-                should_remind = True
-        elif reminder_type == 'monthly':
-            if current_date[8:] == date[8:]:
-                should_remind = True
-        elif reminder_type == 'yearly':
-            if current_date[5:] == date[5:]:
-                should_remind = True
-        elif reminder_type == 'once':
-            if current_date == date:
-                should_remind = True
+        metrics.REMINDERS_DUE.inc()
+        lag = max(lag, now_timestamp - reminder.next_fire_at)
+        entries.append((reminder.id, reminder.next_fire_at, reminder.user_id, messages[reminder.id], reminder.digest))
+    
+    # Пользователям в режиме сводки — одно сообщение на все их напоминания за проход
+    enqueue_reminders(delivery, entries, DIGEST_MAX_LENGTH)
+    await async_db.set_scheduler_state(keys, now_timestamp)
+    metrics.TICK_LAG.set(lag)
+    metrics.TICK_DURATION.observe(time.perf_counter() - started)
+
+async def resume_deliveries(delivery, partitions=None, partition_count=None, worker_id=None, include_own=True):
+    # Отправки, которые были в очереди при остановке или сбое, остались в журнале
+    # со статусом pending. Слишком старые не отправляем, как и в check_reminders.
+    # С worker_id берём только отправки неработающих процессов (и свои, если
+    # include_own): очередь живого процесса он отправит сам. Уже стоящие в нашей
+    # очереди (партиция вернулась к нам) не дублируем
+    pending = await async_db.get_pending_deliveries(partitions, partition_count, worker_id, include_own)
+    pending = [entry for entry in pending if not delivery.is_queued(entry[:2])]
+    horizon = format_next_fire(utc_now() - timedelta(minutes=SCHEDULER_MAX_CATCHUP_MINUTES))
+    
+    expired = []
+    entries = []
+    for reminder_id, occurrence, user_id, body, digest in pending:
+        if occurrence <= horizon:
+            expired.append((reminder_id, occurrence, user_id, 'failed', 0, 'expired', None))
+            continue
+        entries.append((reminder_id, occurrence, user_id, body, bool(digest)))
+    enqueue_reminders(delivery, entries, DIGEST_MAX_LENGTH)
+    if expired:
+        await async_db.finish_deliveries(expired)
+        metrics.REMINDERS_SKIPPED.inc(len(expired))
+    
+    resumed = len(pending) - len(expired)
+    metrics.DELIVERIES_RESUMED.inc(resumed)
+    if pending:
+        logging.info(f"Resumed {resumed} pending deliveries, {len(expired)} expired")
+
+async def record_deliveries(application: Application, results):
+    # Пользователей, чей чат недоступен, база приостанавливает; убираем их
+    # напоминания из очереди планировщика
+    suspended = await async_db.finish_deliveries(results)
+    if not suspended:
+        return
+    metrics.USERS_SUSPENDED.inc(len(suspended))
+    logging.info(f"Suspended reminders of {len(suspended)} unreachable users")
+    scheduler = application.bot_data.get('scheduler')
+    reminder_ids = [reminder_id for ids in suspended.values() for reminder_id in ids]
+    if scheduler and reminder_ids:
+        await scheduler.reschedule(*reminder_ids)
+
+async def upcoming_reminders(application: Application, until):
+    # Перечитывание расписания в режиме нескольких процессов: только свои
+    # партиции и только срабатывания до until — диапазон по индексу
+    # next_fire_at, а не все активные напоминания
+    leases = application.bot_data.get('leases')
+    if not leases:
+        return []
+    reminders = await async_db.get_due_reminders(until, leases.partitions, leases.partition_count)
+    return [(reminder.id, reminder.next_fire_at) for reminder in reminders]
+
+async def start_scheduler(application: Application):
+    if METRICS_PORT:
+        application.bot_data['metrics_server'] = await metrics.start_server(METRICS_HOST, METRICS_PORT)
+    
+    delivery = DeliveryQueue(
+        application.bot,
+        on_finished=lambda results: record_deliveries(application, results),
+        workers=DELIVERY_WORKERS,
+        global_rate=DELIVERY_GLOBAL_RATE,
+        chat_interval=DELIVERY_CHAT_INTERVAL,
+        max_attempts=DELIVERY_MAX_ATTEMPTS,
+        retry_base_delay=DELIVERY_RETRY_BASE_DELAY
+    )
+    delivery.start()
+    metrics.DELIVERY_PENDING.set_function(delivery.pending)
+    application.bot_data['delivery'] = delivery
+    
+    context = CallbackContext(application)
+    if WORKER_PARTITIONING:
+        # Расписание своих партиций планировщик перечитывает сам после запуска
+        scheduler = ReminderScheduler(
+            lambda: check_reminders(context),
+            resync=lambda until: upcoming_reminders(application, until),
+            resync_interval=WORKER_RESYNC_INTERVAL
+        )
+    else:
+        scheduler = ReminderScheduler(lambda: check_reminders(context))
+        await scheduler.load()
+    application.bot_data['scheduler'] = scheduler
+    
+    if WORKER_PARTITIONING:
+        worker_id = WORKER_ID or f"{socket.gethostname()}:{os.getpid()}"
         
-        logging.info(f"Should remind: {should_remind}, last_reminded: {last_reminded}")
+        # Отправки в журнале поднимаем после каждого продления аренды. В забранных
+        # партициях — свои (остались с прошлого запуска с тем же WORKER_ID) и
+        # неработающих процессов; отправки прежнего владельца, который жив, стоят
+        # в его очереди, и он отправит их сам. В остальных своих партициях —
+        # только отправки процессов, которые перестали работать уже после передачи.
+        # Новые партиции планировщик увидит после этого, так что захваченные
+        # им напоминания не попадут в очередь дважды.
+        # Лимит Telegram общий на токен: процесс получает долю DELIVERY_GLOBAL_RATE
+        # по числу своих партиций, в сумме выходит не больше лимита
+        async def partitions_renewed(partitions, acquired):
+            delivery.set_rate(max(DELIVERY_GLOBAL_RATE * len(partitions) / WORKER_PARTITION_COUNT, 1))
+            if acquired:
+                await resume_deliveries(delivery, acquired, WORKER_PARTITION_COUNT, worker_id)
+            if partitions - acquired:
+                await resume_deliveries(delivery, partitions - acquired, WORKER_PARTITION_COUNT, worker_id,
+                                        include_own=False)
+            if acquired:
+                scheduler.wake()
         
-        if should_remind and last_reminded != current_date:
-            try:
-                await context.bot.send_message(
-                    chat_id=user_id,
-                    text=f"🔔 Напоминание:\n{text}"
-                )
-                update_last_reminded(reminder_id)
-                logging.info(f"Reminder {reminder_id} sent successfully")
-            except Exception as e:
-                logging.error(f"Failed to send reminder: {e}")
+        leases = PartitionLeases(
+            worker_id,
+            WORKER_PARTITION_COUNT,
+            ttl=WORKER_LEASE_TTL,
+            renew_interval=WORKER_LEASE_RENEW_INTERVAL,
+            on_renew=partitions_renewed
+        )
+        await leases.start()
+        application.bot_data['leases'] = leases
+    else:
+        await resume_deliveries(delivery)
+    scheduler.start()
+    
+    maintenance = Maintenance(MAINTENANCE_INTERVAL, MAINTENANCE_BATCH_SIZE,
+                              MAINTENANCE_ARCHIVE_AFTER_DAYS, MAINTENANCE_VACUUM_PAGES,
+                              DELIVERY_HISTORY_DAYS)
+    maintenance.start()
+    application.bot_data['maintenance'] = maintenance
 
-def main():
-    # Инициализация базы данных
-    init_db()
+async def stop_scheduler(application: Application):
+    maintenance = application.bot_data.pop('maintenance', None)
+    if maintenance:
+        await maintenance.stop()
     
-    # Создание приложения
+    scheduler = application.bot_data.pop('scheduler', None)
+    if scheduler:
+        await scheduler.stop()
+    
+    # Освобождаем партиции сразу, не дожидаясь истечения аренды
+    leases = application.bot_data.pop('leases', None)
+    if leases:
+        await leases.stop()
+    
+    delivery = application.bot_data.pop('delivery', None)
+    if delivery:
+        await delivery.stop()
+    
+    await asyncio.to_thread(async_db.shutdown)
+    
+    metrics_server = application.bot_data.pop('metrics_server', None)
+    if metrics_server:
+        metrics_server.close()
+        await metrics_server.wait_closed()
+
+async def run_worker():
+    # Только планировщик и отправка, без приёма обновлений от Telegram
     application = Application.builder().token(TELEGRAM_TOKEN).build()
+    async with application:
+        await start_scheduler(application)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await stop_scheduler(application)
+
+async def run_webhook(application: Application):
+    # Жизненный цикл повторяет run_polling: обработчики останавливаются и
+    # состояние сохраняется до остановки планировщика и потоков базы
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: остаётся KeyboardInterrupt
+    
+    server = WebhookServer(application, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET_TOKEN)
+    try:
+        async with application:
+            await start_scheduler(application)
+            await application.start()
+            await server.start()
+            # Без WEBHOOK_URL webhook не регистрируется — так удобно проверять
+            # сервер локально, отправляя ему сохранённые обновления
+            if WEBHOOK_URL:
+                await application.bot.set_webhook(
+                    WEBHOOK_URL,
+                    secret_token=WEBHOOK_SECRET_TOKEN or None,
+                    max_connections=WEBHOOK_MAX_CONNECTIONS
+                )
+            try:
+                await stop.wait()
+            finally:
+                await server.stop()
+                await application.stop()
+    finally:
+        await stop_scheduler(application)
+
+def build_application(polling):
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .persistence(SQLitePersistence(PERSISTENCE_UPDATE_INTERVAL, PERSISTENCE_STATE_TTL))
+    )
+    if polling:
+        # При polling обновления обрабатываются по очереди, как и раньше:
+        # диалоги в context.user_data не рассчитаны на параллельную обработку
+        builder = builder.post_init(start_scheduler).post_shutdown(stop_scheduler)
+    else:
+        # Обновления кладёт WebhookServer, встроенный Updater не нужен. Разные
+        # пользователи обрабатываются параллельно, один пользователь — по очереди
+        builder = builder.updater(None).concurrent_updates(PerUserUpdateProcessor(CONCURRENT_UPDATES))
+    application = builder.build()
     
     # Установка команд бота
     application.job_queue.run_once(setup_commands, when=1, data=application)
     
-    # Обработчики
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("new", new_reminder))
-    application.add_handler(CommandHandler("list", list_reminders))
-    application.add_handler(CallbackQueryHandler(button_callback))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_input))
+    # Обработчики; время каждого попадает в метрику reminder_bot_handler_duration_seconds
+    application.add_handler(CommandHandler("start", timed_handler(start)))
+    application.add_handler(CommandHandler("help", timed_handler(help_command)))
+    application.add_handler(CommandHandler("new", timed_handler(new_reminder)))
+    application.add_handler(CommandHandler("list", timed_handler(list_reminders)))
+    application.add_handler(CommandHandler("timezone", timed_handler(timezone_command)))
+    application.add_handler(CommandHandler("digest", timed_handler(digest_command)))
+    application.add_handler(CommandHandler("export", timed_handler(export_command)))
+    application.add_handler(CommandHandler("import", timed_handler(import_command)))
+    application.add_handler(MessageHandler(filters.Document.ALL, timed_handler(handle_document)))
+    application.add_handler(CallbackQueryHandler(timed_handler(button_callback)))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, timed_handler(handle_text_input)))
+    return application
+
+def main():
+    parser = argparse.ArgumentParser(description='Telegram Reminder Bot')
+    parser.add_argument('--worker', action='store_true',
+                        help='запустить только планировщик напоминаний, без обработки сообщений')
+    args = parser.parse_args()
+    if args.worker and DATABASE_ENGINE == 'memory':
+        parser.error("--worker работает с общей базой, а DATABASE_ENGINE = 'memory' хранит данные внутри процесса")
+    
+    # Инициализация базы данных
+    storage.init_db()
+    
+    if args.worker:
+        try:
+            asyncio.run(run_worker())
+        except KeyboardInterrupt:
+            pass
+        return
     
-    # Настройка проверки напоминаний через job_queue
-    job_queue = application.job_queue
-    job_queue.run_repeating(check_reminders, interval=60, first=1)
+    if UPDATE_MODE == 'webhook':
+        try:
+            asyncio.run(run_webhook(build_application(polling=False)))
+        except KeyboardInterrupt:
+            pass
+        return
     
     # Запуск бота
-    application.run_polling()
+    build_application(polling=True).run_polling()
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
@@ -0,0 +1,179 @@
+import asyncio
+import functools
+import logging
+import time
+
+# Простые метрики в текстовом формате Prometheus без внешних зависимостей.
+# Все изменения делаются из event loop, поэтому блокировки не нужны.
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registry = []
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, description, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        if not self.labelnames and self.kind != 'histogram':
+            # Счётчик без меток виден с нуля, а не с первого события
+            self._values[()] = 0
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def _samples(self):
+        for key, value in self._values.items():
+            yield self.name, key, value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.kind}']
+        for name, labels, value in self._samples():
+            lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines)
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, description, labelnames=()):
+        super().__init__(name, description, labelnames)
+        self._function = None
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def set_function(self, function):
+        # Значение считается при каждом запросе метрик (например, длина очереди)
+        self._function = function
+
+    def _samples(self):
+        if self._function is not None:
+            yield self.name, (), self._function()
+            return
+        yield from super()._samples()
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, description, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            # Счётчики по корзинам (не накопительные), сумма и количество
+            state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        counts = state[0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        state[1] += value
+        state[2] += 1
+
+    def _samples(self):
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket', key + (('le', _format_value(float(bound))),), cumulative
+            yield f'{self.name}_bucket', key + (('le', '+Inf'),), count
+            yield f'{self.name}_sum', key, total
+            yield f'{self.name}_count', key, count
+
+def render():
+    return '\n'.join(metric.render() for metric in _registry) + '\n'
+
+def timed(histogram, **labels):
+    """Декоратор корутины: длительность каждого вызова пишется в histogram."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, **labels)
+        return wrapper
+    return decorator
+
+# Метрики бота. Объявлены здесь, а не рядом с кодом, чтобы весь список
+# был в одном месте и имена не расходились между модулями
+
+TICK_DURATION = Histogram('reminder_bot_tick_duration_seconds', 'Длительность одного прохода check_reminders')
+TICK_LAG = Gauge('reminder_bot_tick_lag_seconds', 'Опоздание самого просроченного напоминания в последнем проходе')
+REMINDERS_DUE = Counter('reminder_bot_reminders_due_total', 'Напоминания, выбранные к отправке')
+REMINDERS_SKIPPED = Counter('reminder_bot_reminders_skipped_total',
+                            'Напоминания, пропущенные из-за выхода за окно догоняния')
+
+DELIVERIES = Counter('reminder_bot_deliveries_total', 'Попытки отправки по результату', ('result',))
+SEND_DURATION = Histogram('reminder_bot_send_duration_seconds', 'Длительность вызова send_message')
+DELIVERY_DELAY = Histogram('reminder_bot_delivery_delay_seconds',
+                           'От постановки в очередь до успешной отправки')
+DELIVERIES_RESUMED = Counter('reminder_bot_deliveries_resumed_total',
+                             'Незавершённые отправки из журнала, поднятые при запуске')
+USERS_SUSPENDED = Counter('reminder_bot_users_suspended_total',
+                          'Пользователи, доставка которым приостановлена: чат недоступен')
+DELIVERY_PENDING = Gauge('reminder_bot_delivery_pending', 'Напоминания в очереди отправки')
+
+DB_QUERY_DURATION = Histogram('reminder_bot_db_query_duration_seconds',
+                              'Длительность запроса к базе вместе с ожиданием в очереди потока',
+                              ('query', 'kind'))
+MAINTENANCE_ROWS = Counter('reminder_bot_maintenance_rows_total',
+                           'Строки, обработанные обслуживанием базы (для vacuum — страницы)', ('action',))
+CACHE_REQUESTS = Counter('reminder_bot_cache_requests_total', 'Обращения к кэшам чтения', ('cache', 'result'))
+HANDLER_DURATION = Histogram('reminder_bot_handler_duration_seconds', 'Длительность обработки обновления',
+                             ('handler',))
+
+async def _handle(reader, writer):
+    try:
+        request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout=5)
+        method, path = request.split(b' ', 2)[:2]
+        if method == b'GET' and path.split(b'?')[0] == b'/metrics':
+            status, body = '200 OK', render().encode()
+        else:
+            status, body = '404 Not Found', b'Not Found\n'
+        writer.write(
+            f'HTTP/1.1 {status}\r\n'
+            f'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: close\r\n\r\n'.encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def start_server(host, port):
+    """HTTP-эндпоинт /metrics для Prometheus; возвращает asyncio.Server."""
+    server = await asyncio.start_server(_handle, host, port)
+    logging.info(f"Metrics available at http://{host}:{port}/metrics")
+    return server
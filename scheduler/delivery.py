@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import time
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+from monitoring.metrics import DELIVERIES, SEND_DURATION, DELIVERY_DELAY
+
+# Ответы BadRequest, после которых писать в чат бессмысленно
+_UNREACHABLE_CHAT_ERRORS = ('chat not found', 'user not found', 'peer_id_invalid', 'user is deactivated')
+
+# Сколько помнить недоступный чат, чтобы не слать ему уже стоящие в очереди сообщения
+_UNREACHABLE_MEMORY = 3600
+
+def classify_error(error):
+    """Возвращает (код ошибки, недоступен ли чат насовсем)."""
+    # Forbidden: бот заблокирован, аккаунт удалён или бота исключили из чата
+    if isinstance(error, Forbidden):
+        return 'forbidden', True
+    # BadRequest — подкласс NetworkError, проверяем раньше
+    if isinstance(error, BadRequest):
+        message = str(error).lower()
+        if any(text in message for text in _UNREACHABLE_CHAT_ERRORS):
+            return 'chat_not_found', True
+        return 'bad_request', False
+    if isinstance(error, TimedOut):
+        return 'timed_out', False
+    if isinstance(error, NetworkError):
+        return 'network', False
+    return 'error', False
+
+class RateLimiter:
+    """Равномерно распределяет вызовы: не больше rate в секунду."""
+
+    def __init__(self, rate):
+        self._interval = 1 / rate
+        self._next_slot = 0
+        self._lock = asyncio.Lock()
+
+    def set_rate(self, rate):
+        self._interval = 1 / rate
+
+    async def acquire(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            delay = self._next_slot - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_slot = max(loop.time(), self._next_slot) + self._interval
+
+    def pause(self, seconds):
+        loop = asyncio.get_running_loop()
+        self._next_slot = max(self._next_slot, loop.time() + seconds)
+
+class DeliveryItem:
+    # keys — пары (reminder_id, occurrence) всех напоминаний в сообщении:
+    # в режиме сводки их несколько
+    __slots__ = ('keys', 'chat_id', 'text', 'attempt', 'enqueued_at')
+
+    def __init__(self, keys, chat_id, text):
+        self.keys = keys
+        self.chat_id = chat_id
+        self.text = text
+        self.attempt = 0
+        self.enqueued_at = time.monotonic()
+
+    @property
+    def reminder_ids(self):
+        return ','.join(str(reminder_id) for reminder_id, _ in self.keys)
+
+class DeliveryQueue:
+    """Очередь отправки напоминаний с ограниченным пулом воркеров.
+
+    Соблюдает общий лимит Telegram и интервал между сообщениями в один чат,
+    учитывает RetryAfter и повторяет временные ошибки с экспоненциальной
+    задержкой. Корутина on_finished получает пачку итогов отправки — по кортежу
+    (reminder_id, occurrence, chat_id, статус, число попыток, код ошибки, ошибка)
+    на каждое напоминание сообщения; статус — 'sent', 'failed' или
+    'undeliverable', если чат недоступен насовсем (см. classify_error):
+    пачка сбрасывается, когда очередь опустела или набралось finished_batch_size.
+    """
+
+    def __init__(self, bot, on_finished=None, workers=8, global_rate=25, chat_interval=1.0,
+                 max_attempts=5, retry_base_delay=2.0, finished_batch_size=200):
+        self._bot = bot
+        self._on_finished = on_finished
+        self._workers_count = workers
+        self._limiter = RateLimiter(global_rate)
+        self._chat_interval = chat_interval
+        self._chat_next_slot = {}
+        self._max_attempts = max_attempts
+        self._retry_base_delay = retry_base_delay
+        self._queue = asyncio.Queue()
+        self._workers = []
+        self._retry_handles = set()
+        self._finished = []
+        self._finished_batch_size = finished_batch_size
+        self._flushes = set()
+        self._unreachable = {}
+        # Ключи, итог которых ещё не записан в журнал
+        self._keys = set()
+
+    def enqueue(self, keys, chat_id, text):
+        self._keys.update(keys)
+        self._queue.put_nowait(DeliveryItem(keys, chat_id, text))
+
+    def is_queued(self, key):
+        return key in self._keys
+
+    def set_rate(self, global_rate):
+        self._limiter.set_rate(global_rate)
+
+    def pending(self):
+        return self._queue.qsize() + len(self._retry_handles)
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self._workers_count)]
+
+    async def join(self):
+        await self._queue.join()
+
+    async def stop(self):
+        for handle in self._retry_handles:
+            handle.cancel()
+        self._retry_handles.clear()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        await asyncio.gather(*self._flushes, return_exceptions=True)
+        await self._flush_finished()
+        if not self._queue.empty():
+            # В журнале они остаются pending и отправятся после запуска
+            logging.warning(f"Delivery stopped with {self._queue.qsize()} undelivered reminders")
+
+    def _requeue_later(self, item, delay):
+        loop = asyncio.get_running_loop()
+        handle = None
+
+        def put():
+            self._retry_handles.discard(handle)
+            self._queue.put_nowait(item)
+
+        handle = loop.call_later(delay, put)
+        self._retry_handles.add(handle)
+
+    def _chat_delay(self, chat_id):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        next_slot = self._chat_next_slot.get(chat_id, 0)
+        if next_slot > now:
+            return next_slot - now
+        self._chat_next_slot[chat_id] = now + self._chat_interval
+        # Не даём словарю расти бесконечно
+        if len(self._chat_next_slot) > 10000:
+            self._chat_next_slot = {
+                chat: slot for chat, slot in self._chat_next_slot.items() if slot > now
+            }
+        return 0
+
+    async def _worker(self):
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._deliver(item)
+            except Exception as e:
+                logging.error(f"Delivery of reminder {item.reminder_ids} crashed: {e}")
+                self._finish(item, 'failed', 'error', str(e))
+            finally:
+                self._queue.task_done()
+            if self._queue.empty() or len(self._finished) >= self._finished_batch_size:
+                await self._flush_finished()
+
+    def _finish(self, item, status, error_code=None, error=None):
+        self._finished.extend((reminder_id, occurrence, item.chat_id, status, item.attempt, error_code, error)
+                              for reminder_id, occurrence in item.keys)
+
+    def _mark_unreachable(self, chat_id):
+        now = time.monotonic()
+        self._unreachable[chat_id] = now
+        if len(self._unreachable) > 10000:
+            self._unreachable = {
+                chat: since for chat, since in self._unreachable.items() if since > now - _UNREACHABLE_MEMORY
+            }
+
+    def _is_unreachable(self, item):
+        # Только для сообщений, поставленных до ошибки: после /start
+        # пользователь снова получает новые напоминания
+        since = self._unreachable.get(item.chat_id)
+        return since is not None and item.enqueued_at <= since
+
+    async def _flush_finished(self):
+        if not self._finished or not self._on_finished:
+            return
+        finished, self._finished = self._finished, []
+        # Запись не должна оборваться, если stop отменит воркер: иначе итоги
+        # потеряются и отправки после перезапуска уйдут повторно. stop её дождётся
+        flush = asyncio.create_task(self._record_finished(finished))
+        self._flushes.add(flush)
+        flush.add_done_callback(self._flushes.discard)
+        await asyncio.shield(flush)
+
+    async def _record_finished(self, finished):
+        try:
+            await self._on_finished(finished)
+        except Exception as e:
+            logging.error(f"Failed to record {len(finished)} delivery results: {e}")
+        finally:
+            self._keys.difference_update((reminder_id, occurrence) for reminder_id, occurrence, *_ in finished)
+
+    async def _deliver(self, item):
+        if self._is_unreachable(item):
+            DELIVERIES.inc(result='suppressed')
+            self._finish(item, 'undeliverable', 'suppressed')
+            return
+
+        chat_delay = self._chat_delay(item.chat_id)
+        if chat_delay > 0:
+            # Чат ещё не готов — возвращаем в очередь, не занимая воркер
+            self._requeue_later(item, chat_delay)
+            return
+
+        await self._limiter.acquire()
+        item.attempt += 1
+        started = time.monotonic()
+        try:
+            await self._bot.send_message(chat_id=item.chat_id, text=item.text)
+        except RetryAfter as e:
+            DELIVERIES.inc(result='flood_wait')
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else e.retry_after
+            logging.warning(f"Flood control, pausing delivery for {retry_after}s")
+            self._limiter.pause(retry_after)
+            item.attempt -= 1
+            self._requeue_later(item, retry_after)
+            return
+        except (Forbidden, BadRequest) as e:
+            error_code, unreachable = classify_error(e)
+            if unreachable:
+                # Обычная ситуация (пользователь заблокировал бота), не ошибка бота
+                DELIVERIES.inc(result='undeliverable')
+                logging.warning(f"Chat {item.chat_id} is unreachable ({error_code}), reminder {item.reminder_ids} dropped")
+                self._mark_unreachable(item.chat_id)
+                self._finish(item, 'undeliverable', error_code, str(e))
+                return
+            DELIVERIES.inc(result='rejected')
+            logging.error(f"Failed to send reminder {item.reminder_ids}: {e}")
+            self._finish(item, 'failed', error_code, str(e))
+            return
+        except Exception as e:
+            if item.attempt >= self._max_attempts:
+                DELIVERIES.inc(result='failed')
+                logging.error(f"Failed to send reminder {item.reminder_ids} after {item.attempt} attempts: {e}")
+                self._finish(item, 'failed', classify_error(e)[0], str(e))
+                return
+            DELIVERIES.inc(result='retried')
+            delay = self._retry_base_delay * 2 ** (item.attempt - 1)
+            logging.warning(f"Failed to send reminder {item.reminder_ids}, retrying in {delay}s: {e}")
+            self._requeue_later(item, delay)
+            return
+
+        finished = time.monotonic()
+        SEND_DURATION.observe(finished - started)
+        DELIVERY_DELAY.observe(finished - item.enqueued_at)
+        DELIVERIES.inc(result='sent')
+        # Построчный лог — только при LOG_LEVEL = 'DEBUG'; ленивое форматирование,
+        # чтобы не тратить время на строку, которую никто не увидит
+        logging.debug("Reminder %s sent successfully", item.reminder_ids)
+        self._finish(item, 'sent')
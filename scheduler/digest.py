@@ -0,0 +1,45 @@
+# Сообщения о сработавших напоминаниях. В журнал отправок (deliveries) пишется
+# тело — текст напоминания с пометкой об опоздании; заголовок добавляется при
+# постановке в очередь. В режиме сводки напоминания пользователя из одного
+# прохода планировщика объединяются в одно сообщение (или несколько, если не
+# помещаются в max_length)
+
+DIGEST_HEADER = "🔔 Напоминания:\n\n"
+DIGEST_SEPARATOR = "\n\n"
+
+def format_single(body):
+    return f"🔔 Напоминание:\n{body}"
+
+def _truncate(text, limit):
+    return text if len(text) <= limit else text[:limit - 1] + '…'
+
+def build_messages(entries, digest, max_length):
+    """entries — пары (ключ, тело) одного пользователя; возвращает пары
+    (ключи, текст сообщения)."""
+    if not digest or len(entries) == 1:
+        return [([key], format_single(body)) for key, body in entries]
+
+    messages = []
+    keys, lines, length = [], [], len(DIGEST_HEADER)
+    for number, (key, body) in enumerate(entries, 1):
+        # Слишком длинное напоминание обрезаем, чтобы сообщение приняли
+        line = _truncate(f"{number}. {body}", max_length - len(DIGEST_HEADER))
+        if lines and length + len(DIGEST_SEPARATOR) + len(line) > max_length:
+            messages.append((keys, DIGEST_HEADER + DIGEST_SEPARATOR.join(lines)))
+            keys, lines, length = [], [], len(DIGEST_HEADER)
+        if lines:
+            length += len(DIGEST_SEPARATOR)
+        keys.append(key)
+        lines.append(line)
+        length += len(line)
+    messages.append((keys, DIGEST_HEADER + DIGEST_SEPARATOR.join(lines)))
+    return messages
+
+def enqueue_reminders(delivery, entries, max_length):
+    # entries — (reminder_id, occurrence, user_id, тело, режим сводки)
+    by_user = {}
+    for reminder_id, occurrence, user_id, body, digest in entries:
+        by_user.setdefault(user_id, (digest, []))[1].append(((reminder_id, occurrence), body))
+    for user_id, (digest, user_entries) in by_user.items():
+        for keys, text in build_messages(user_entries, digest, max_length):
+            delivery.enqueue(keys, user_id, text)
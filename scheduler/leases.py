@@ -0,0 +1,57 @@
+import asyncio
+import logging
+from database.async_db import acquire_partitions, release_partitions
+
+class PartitionLeases:
+    """Аренда партиций напоминаний для запуска нескольких планировщиков.
+
+    Напоминания делятся на partition_count партиций по user_id. Каждый процесс
+    периодически продлевает аренду своих партиций и забирает свободные, пока
+    не наберёт свою долю. Партиции упавшего процесса освобождаются через ttl.
+    После каждого продления корутина on_renew получает все партиции процесса
+    и те, что он только что забрал; пока она работает, планировщик видит
+    только прежние партиции.
+    """
+
+    def __init__(self, worker_id, partition_count, ttl, renew_interval, on_renew=None):
+        self.worker_id = worker_id
+        self.partition_count = partition_count
+        self.partitions = frozenset()
+        self._ttl = ttl
+        self._renew_interval = renew_interval
+        self._on_renew = on_renew
+        self._task = None
+
+    async def renew(self):
+        partitions = frozenset(await acquire_partitions(self.worker_id, self.partition_count, self._ttl))
+        if partitions != self.partitions:
+            logging.info(f"Worker {self.worker_id} now owns partitions {sorted(partitions)}")
+        acquired = partitions - self.partitions
+        if self._on_renew:
+            self.partitions = partitions - acquired
+            await self._on_renew(partitions, acquired)
+        self.partitions = partitions
+
+    async def start(self):
+        await self.renew()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.partitions = frozenset()
+        await release_partitions(self.worker_id)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self._renew_interval)
+            try:
+                await self.renew()
+            except Exception as e:
+                # Не продлили вовремя — другие процессы заберут наши партиции
+                logging.error(f"Failed to renew partition leases: {e}")
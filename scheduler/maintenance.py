@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from database.async_db import deactivate_completed, archive_reminders, incremental_vacuum, prune_deliveries
+from database.recurrence import date_to_int
+from monitoring.metrics import MAINTENANCE_ROWS
+
+class Maintenance:
+    """Периодическая уборка таблицы напоминаний.
+
+    Отключает сработавшие одноразовые напоминания, переносит удалённые и
+    прошедшие строки в reminders_archive, удаляет старую историю отправок
+    и возвращает освободившееся место.
+    Работает небольшими транзакциями через общий поток записи, поэтому
+    изменения от обработчиков между пачками не ждут.
+    """
+
+    def __init__(self, interval, batch_size, archive_after_days, vacuum_pages, history_days):
+        self._interval = interval
+        self._batch_size = batch_size
+        self._archive_after = timedelta(days=archive_after_days)
+        self._history = timedelta(days=history_days)
+        self._vacuum_pages = vacuum_pages
+        self._task = None
+
+    async def run_once(self):
+        deactivated = await self._repeat(lambda: deactivate_completed(self._batch_size))
+
+        # Удалённые держим archive_after, чтобы не мешать обработке уже открытых сообщений
+        deleted_before = int(time.time() - self._archive_after.total_seconds())
+        expired_before = date_to_int((datetime.now() - self._archive_after).strftime('%Y-%m-%d'))
+        archived = await self._repeat(lambda: archive_reminders(deleted_before, expired_before, self._batch_size))
+
+        finished_before = int(time.time() - self._history.total_seconds())
+        pruned = await self._repeat(lambda: prune_deliveries(finished_before, self._batch_size))
+
+        vacuumed = await self._repeat(lambda: incremental_vacuum(self._vacuum_pages))
+
+        MAINTENANCE_ROWS.inc(deactivated, action='deactivated')
+        MAINTENANCE_ROWS.inc(archived, action='archived')
+        MAINTENANCE_ROWS.inc(pruned, action='pruned_deliveries')
+        MAINTENANCE_ROWS.inc(vacuumed, action='vacuumed_pages')
+        if deactivated or archived or pruned or vacuumed:
+            logging.info(f"Maintenance: deactivated {deactivated}, archived {archived} reminders, "
+                         f"pruned {pruned} deliveries, freed {vacuumed} pages")
+
+    async def _repeat(self, step):
+        # Повторяем шаг, пока он что-то обрабатывает: по неполной пачке нельзя
+        # судить, что работа закончена, — хранилище может ограничивать пачку
+        # сильнее (archive_reminders в SQLite берёт не больше 500 строк)
+        total = 0
+        while True:
+            done = await step()
+            total += done
+            if not done:
+                return total
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logging.error(f"Maintenance failed: {e}")
+            await asyncio.sleep(self._interval)
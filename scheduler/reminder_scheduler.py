@@ -0,0 +1,163 @@
+import asyncio
+import heapq
+import logging
+import time
+from datetime import timedelta
+from database.async_db import get_scheduled_reminders
+from database.recurrence import format_next_fire, parse_next_fire, utc_now
+
+# Предохранитель от скачков системных часов: дольше этого планировщик не спит
+MAX_SLEEP = 60
+
+class ReminderScheduler:
+    """Очередь ближайших срабатываний в памяти (min-heap по времени).
+
+    Загружается из базы один раз при старте, дальше обновляется обработчиками
+    через await reschedule(). Когда наступает время первого напоминания в куче,
+    вызывается tick — он отправляет всё, что пора отправить.
+
+    С resync (несколько процессов) вместо полной загрузки каждые
+    resync_interval секунд перечитываются только ближайшие срабатывания:
+    корутина resync(until) возвращает пары (id, next_fire_at) напоминаний
+    своих партиций со временем не позже until.
+    """
+
+    def __init__(self, tick, resync=None, resync_interval=None):
+        self._tick = tick
+        self._heap = []
+        self._entries = {}
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._force_tick = False
+        # Процессы не узнают о напоминаниях, созданных другими процессами, —
+        # им нужно периодически перечитывать расписание из базы
+        self._resync = resync
+        self._resync_interval = resync_interval
+        self._resynced_at = None
+
+    async def load(self):
+        self._heap.clear()
+        self._entries.clear()
+        for reminder_id, next_fire_at in await get_scheduled_reminders():
+            self._entries[reminder_id] = parse_next_fire(next_fire_at)
+        self._heap = [(fire_at, reminder_id) for reminder_id, fire_at in self._entries.items()]
+        heapq.heapify(self._heap)
+        logging.info(f"Scheduler loaded {len(self._heap)} reminders")
+
+    def schedule(self, reminder_id, next_fire_at):
+        if next_fire_at is None:
+            self.cancel(reminder_id)
+            return
+
+        fire_at = parse_next_fire(next_fire_at)
+        if self._entries.get(reminder_id) == fire_at:
+            return
+
+        # Старая запись остаётся в куче и отбрасывается при извлечении
+        self._entries[reminder_id] = fire_at
+        heapq.heappush(self._heap, (fire_at, reminder_id))
+        if self._heap[0] == (fire_at, reminder_id):
+            self._wakeup.set()
+
+    def cancel(self, reminder_id):
+        self._entries.pop(reminder_id, None)
+
+    async def reschedule(self, *reminder_ids):
+        for reminder_id, next_fire_at in await get_scheduled_reminders(reminder_ids):
+            self.schedule(reminder_id, next_fire_at)
+
+    def wake(self):
+        # Внеочередной tick (и перечитывание), например после получения новых партиций
+        self._force_tick = True
+        self._resynced_at = None
+        self._wakeup.set()
+
+    def next_fire_at(self):
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def _drop_stale(self):
+        while self._heap:
+            fire_at, reminder_id = self._heap[0]
+            if self._entries.get(reminder_id) == fire_at:
+                return
+            heapq.heappop(self._heap)
+
+    def _pop_due(self, now):
+        due = []
+        while True:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return due
+            _, reminder_id = heapq.heappop(self._heap)
+            del self._entries[reminder_id]
+            due.append(reminder_id)
+
+    async def _resync_upcoming(self):
+        # Окно — два интервала: следующее перечитывание может немного опоздать.
+        # Удалённые за это время напоминания остаются в куче и отбрасываются
+        # в _requeue после пустого tick
+        until = utc_now() + timedelta(seconds=2 * self._resync_interval)
+        for reminder_id, next_fire_at in await self._resync(until):
+            self.schedule(reminder_id, next_fire_at)
+
+    async def _run(self):
+        while True:
+            if self._resync and (self._resynced_at is None
+                                 or time.monotonic() - self._resynced_at >= self._resync_interval):
+                try:
+                    await self._resync_upcoming()
+                except Exception as e:
+                    logging.error(f"Failed to resync schedule: {e}")
+                self._resynced_at = time.monotonic()
+
+            fire_at = self.next_fire_at()
+            delay = MAX_SLEEP if fire_at is None else (fire_at - utc_now()).total_seconds()
+
+            if delay > 0 and not self._force_tick:
+                if self._resync:
+                    delay = min(delay, self._resynced_at + self._resync_interval - time.monotonic())
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), max(min(delay, MAX_SLEEP), 0))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._force_tick = False
+            now = utc_now()
+            due = self._pop_due(now)
+            try:
+                await self._tick()
+            except Exception as e:
+                logging.error(f"Reminder tick failed: {e}")
+
+            try:
+                await self._requeue(due, now)
+            except Exception as e:
+                logging.error(f"Failed to requeue reminders: {e}")
+
+    async def _requeue(self, reminder_ids, now):
+        for reminder_id, next_fire_at in await get_scheduled_reminders(reminder_ids):
+            if next_fire_at is None:
+                continue
+            fire_at = parse_next_fire(next_fire_at)
+            if fire_at <= now:
+                # tick не сдвинул напоминание — повторим через минуту, а не в цикле
+                fire_at = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+                next_fire_at = format_next_fire(fire_at)
+            self.schedule(reminder_id, next_fire_at)